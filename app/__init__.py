@@ -8,7 +8,10 @@ from flask_appbuilder import AppBuilder, Base
 from flask_mail import Mail
 
 from .landing import MyIndexView
-from .manager import seed_users, seed_data
+from .manager import seed_users, seed_data, import_cities, precompute_twilight
+from .utils.cities import city_registry
+from .utils.sunrise_cache import sunrise_cache
+from .utils.sunrise_jobs import sunrise_jobs
 
 
 mail = Mail()
@@ -21,6 +24,8 @@ def create_app():
     from .config import Config
 
     app.config.from_object(Config())
+    app.cli.add_command(import_cities)
+    app.cli.add_command(precompute_twilight)
 
     logging.basicConfig(
         stream=sys.stdout,
@@ -49,6 +54,9 @@ def create_app():
     app.app_context().push()
     alembic.upgrade()
     mail.init_app(app)
+    city_registry.init_app(app)
+    sunrise_cache.init_app(app)
+    sunrise_jobs.init_app(app)
     Base.query = db.session.query_property()
     appbuilder.init_app(app, db.session)
 
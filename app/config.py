@@ -64,14 +64,39 @@ class Config:
     MAIL_USE_SSL = False
     MAIL_PORT = 587
 
+    # Sunrise data cache, per gunicorn worker plus an optional shared directory
+    SUNRISE_CACHE_MAX_ENTRIES = int(os.environ.get("SUNRISE_CACHE_MAX_ENTRIES", 64))
+    SUNRISE_CACHE_MAX_BYTES = int(os.environ.get("SUNRISE_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+    SUNRISE_CACHE_DIR = os.environ.get("SUNRISE_CACHE_DIR")
+    SUNRISE_CACHE_DIR_MAX_BYTES = int(os.environ.get("SUNRISE_CACHE_DIR_MAX_BYTES", 1024 * 1024 * 1024))
+    SUNRISE_CHART_CACHE_MAX_ENTRIES = int(os.environ.get("SUNRISE_CHART_CACHE_MAX_ENTRIES", 64))
+    SUNRISE_CHART_CACHE_MAX_BYTES = int(os.environ.get("SUNRISE_CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    # Seconds between checks of CityLocations for changes to reload into the city registry
+    CITY_REGISTRY_TTL = int(os.environ.get("CITY_REGISTRY_TTL", 60))
+    # Coordinates further than this many km from every stored city are not answered
+    CITY_NEAREST_MAX_KM = float(os.environ.get("CITY_NEAREST_MAX_KM", 50))
+    # Cities returned per page of the location search
+    CITY_SEARCH_PAGE_SIZE = int(os.environ.get("CITY_SEARCH_PAGE_SIZE", 20))
+    # Threads per worker computing cold city-years, and the longest a job status poll may wait
+    SUNRISE_JOB_WORKERS = int(os.environ.get("SUNRISE_JOB_WORKERS", 2))
+    SUNRISE_JOB_MAX_WAIT = int(os.environ.get("SUNRISE_JOB_MAX_WAIT", 10))
+    # Seconds browsers may reuse sunrise year and date responses without revalidating
+    SUNRISE_MAX_AGE = int(os.environ.get("SUNRISE_MAX_AGE", 24 * 60 * 60))
+
     # Roles
     SUNRISE_ROLES = [
         ["Sunrise View", "menu_access"],
-        ["SunriseView", "can_graph"],
+        ["SunriseView", "can_year"],
+        ["SunriseView", "can_date"],
+        ["SunriseView", "can_date_range"],
+        ["SunriseView", "can_job"],
+        ["SunriseView", "can_cities"],
+        ["SunriseView", "can_nearest"],
         ["SunriseView", "can_this_form_get"],
         ["SunriseView", "can_this_form_post"],
         ["AstralPositions View", "menu_access"],
         ["AstralPositionsView", "can_comingsoon"],
+        ["AstralPositionsView", "can_conjunctions"],
     ]
     FAB_ROLES = {
         "Public": [
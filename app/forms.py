@@ -4,15 +4,15 @@ from flask_appbuilder.forms import DynamicForm
 from wtforms import SelectField
 from wtforms.fields.datetime import DateField
 
-from app.models import CityLocations
-
 
 class SunriseForm(DynamicForm):
-    city_locations = CityLocations.query.all()
-    locations = [("", "")]
-    for city in city_locations:
-        locations.append((city.city_name, city.city_name))
-    location = SelectField("Select Location", choices=locations, default="Dublin, Ireland")
+    # Other locations are searched for by the widget, see SunriseView.cities
+    location = SelectField(
+        "Select Location",
+        choices=[("Dublin, Ireland", "Dublin, Ireland")],
+        default="Dublin, Ireland",
+        validate_choice=False,
+    )
     date_select = DateField("Select Date", default=date.today)
 
 
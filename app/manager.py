@@ -1,8 +1,19 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import click
 import pandas as pd
+from flask.cli import with_appcontext
 from flask_appbuilder.security.sqla.models import User, Role
+from skyfield.api import N, E, wgs84
 
 from app.models import db, CityLocations
+from app.utils.ephemeris import get_ephemeris, get_timescale, preload
+from app.utils.sunrise import find_twilight_transitions, year_bounds
+from app.utils.timezones import city_timezone, find_timezone_name
+from app.utils.twilight_store import save_twilight_records, stored_city_ids, twilight_record
 
 
 def seed_users():
@@ -39,21 +50,173 @@ def seed_users():
 def seed_data():
     check_table_data = CityLocations.query.first()
     if not check_table_data:
-        data = pd.read_csv("app/static/city_locations.tsv", sep="\t")
-        add_city_locations(data)
+        import_city_locations("app/static/city_locations.tsv")
+    add_city_timezones()
+
+
+def import_city_locations(path, chunk_size=10000):
+    """Stream a TSV or CSV gazetteer into CityLocations and return the rows added.
+
+    The file is read `chunk_size` rows at a time and each chunk is written
+    with one bulk insert, so large gazetteers never sit in memory whole.
+    """
+    separator = "," if path.endswith(".csv") else "\t"
+    user = User.query.filter_by(username="admin").first()
+    existing = {name for name, in db.session.query(CityLocations.city_name)}
+    added = 0
+    for chunk in pd.read_csv(
+        path, sep=separator, usecols=["city_name", "latitude", "longitude"], chunksize=chunk_size
+    ):
+        added += add_city_locations(chunk, existing, user)
+    return added
+
 
+def add_city_locations(data, existing=None, user=None):
+    """Bulk insert the rows of `data` whose city_name is not in `existing`.
 
-def add_city_locations(data):
+    `existing` defaults to every name already stored and is updated with the
+    names inserted, so it can be passed along from chunk to chunk.
+    """
+    if existing is None:
+        existing = {name for name, in db.session.query(CityLocations.city_name)}
+    if user is None:
+        user = User.query.filter_by(username="admin").first()
+    data = data.drop_duplicates("city_name")
+    data = data[~data["city_name"].isin(existing)]
+    mappings = [
+        {
+            "city_name": row.city_name,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "timezone": find_timezone_name(row.latitude, row.longitude),
+            "created_by_fk": user.id,
+            "changed_by_fk": user.id,
+        }
+        for row in data.itertuples()
+    ]
+    if mappings:
+        db.session.bulk_insert_mappings(CityLocations, mappings)
+        db.session.commit()
+        existing.update(data["city_name"])
+    return len(mappings)
+
+
+def add_city_timezones():
     user = User.query.filter_by(username="admin").first()
-    for row in data.itertuples():
-        city_in_db = CityLocations.query.filter_by(city_name=row.city_name).first()
-        if not city_in_db:
-            city = CityLocations(
-                city_name=row.city_name,
-                latitude=row.latitude,
-                longitude=row.longitude,
-                created_by=user,
-                changed_by=user
-            )
-            db.session.add(city)
-    db.session.commit()
+    cities = CityLocations.query.filter(CityLocations.timezone.is_(None)).all()
+    mappings = [
+        {
+            "id": city.id,
+            "timezone": find_timezone_name(city.latitude, city.longitude),
+            "changed_by_fk": user.id,
+        }
+        for city in cities
+    ]
+    if mappings:
+        db.session.bulk_update_mappings(CityLocations, mappings)
+        db.session.commit()
+
+
+def seed_twilight_data(years, workers=None, chunk_size=50):
+    """Compute and store twilight events for every city over `years`.
+
+    City-years already in the store are skipped, so an interrupted run picks
+    up where it stopped. Each chunk of cities is computed in a worker process
+    and written to the store as soon as it finishes.
+    """
+    cities = [
+        {
+            "id": city.id,
+            "latitude": float(city.latitude),
+            "longitude": float(city.longitude),
+            "timezone": city.timezone,
+        }
+        for city in CityLocations.query.order_by(CityLocations.id)
+    ]
+    chunks = []
+    for year in years:
+        stored_ids = stored_city_ids(year)
+        missing = [city for city in cities if city["id"] not in stored_ids]
+        for start in range(0, len(missing), chunk_size):
+            chunks.append((year, missing[start:start + chunk_size]))
+    total = sum(len(chunk) for _, chunk in chunks)
+    if not total:
+        click.echo("Twilight store already holds every city for those years")
+        return
+
+    click.echo(f"Computing {total} city-years with {workers or os.cpu_count()} workers")
+    preload()
+    timescale = get_timescale()
+    stored = 0
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_twilight_worker) as executor:
+        futures = [executor.submit(compute_twilight_chunk, year, chunk) for year, chunk in chunks]
+        for future in as_completed(futures):
+            records = [
+                twilight_record(city_id, year, timescale.tt_jd(whole, fraction), events)
+                for city_id, year, whole, fraction, events in future.result()
+            ]
+            save_twilight_records(records)
+            stored += len(records)
+            elapsed = time.monotonic() - started
+            click.echo(f"{stored}/{total} city-years stored ({elapsed:.0f} s)")
+
+
+twilight_worker = {}
+
+
+def init_twilight_worker():
+    # Forked workers inherit the kernel the parent preloaded
+    twilight_worker["timescale"] = get_timescale()
+    twilight_worker["eph"] = get_ephemeris()
+
+
+def compute_twilight_chunk(year, cities):
+    # Solved per city exactly as SunriseGraph solves a year missing from the
+    # store, so precomputed and on-demand events are interchangeable
+    timescale = twilight_worker["timescale"]
+    records = []
+    for city in cities:
+        min_date, max_date = year_bounds(city_timezone(city), year)
+        times, events = find_twilight_transitions(
+            twilight_worker["eph"],
+            wgs84.latlon(city["latitude"] * N, city["longitude"] * E),
+            timescale.from_datetime(min_date),
+            timescale.from_datetime(max_date),
+        )
+        records.append((city["id"], year, times.whole, times.tt_fraction, events))
+    return records
+
+
+def parse_years(ctx, param, value):
+    try:
+        first, _, last = value.partition("-")
+        return range(int(first), int(last or first) + 1)
+    except ValueError:
+        raise click.BadParameter("use a year or a range such as 2020-2035")
+
+
+@click.command("import-cities")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", type=int, default=10000, help="Rows read and inserted per batch.")
+@with_appcontext
+def import_cities(path, chunk_size):
+    """Add the cities in a TSV or CSV gazetteer that are not stored yet."""
+    started = time.monotonic()
+    added = import_city_locations(path, chunk_size)
+    click.echo(f"Added {added} cities in {time.monotonic() - started:.1f} s")
+
+
+@click.command("precompute-twilight")
+@click.option(
+    "--years",
+    default=lambda: str(date.today().year),
+    callback=parse_years,
+    help="Year or inclusive range of years, e.g. 2020-2035.",
+)
+@click.option("--workers", type=int, default=None, help="Worker processes, all cores by default.")
+@click.option("--chunk-size", type=int, default=50, help="Cities computed per task.")
+@with_appcontext
+def precompute_twilight(years, workers, chunk_size):
+    """Fill the twilight store for every city in CityLocations."""
+    seed_twilight_data(years, workers, chunk_size)
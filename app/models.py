@@ -1,7 +1,15 @@
 from flask_appbuilder import SQLA, Model
 from flask_appbuilder.models.mixins import AuditMixin
-from sqlalchemy import Column, Integer, String, DECIMAL
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DECIMAL,
+    ForeignKey,
+    LargeBinary,
+    UniqueConstraint,
+)
+from sqlalchemy.orm import declarative_base, relationship
 
 db = SQLA(session_options={"autoflush": False})
 Base = declarative_base()
@@ -9,6 +17,24 @@ Base = declarative_base()
 
 class CityLocations(AuditMixin, Model):
     id = Column(Integer, primary_key=True)
-    city_name = Column(String(512))
+    city_name = Column(String(512), index=True)
     latitude = Column(DECIMAL(9, 6))
     longitude = Column(DECIMAL(9, 6))
+    timezone = Column(String(64))
+
+
+class CityTwilight(Model):
+    """Twilight transitions for one city and year, as returned by find_discrete.
+
+    `times` holds the TT julian dates as two packed float64 arrays (whole days
+    and fraction) so the skyfield Time can be rebuilt exactly, and `events`
+    holds the matching almanac.TWILIGHTS codes as uint8.
+    """
+    __table_args__ = (UniqueConstraint("city_location_id", "year"),)
+
+    id = Column(Integer, primary_key=True)
+    city_location_id = Column(Integer, ForeignKey("city_locations.id"), nullable=False)
+    city_location = relationship("CityLocations")
+    year = Column(Integer, nullable=False)
+    times = Column(LargeBinary(length=2**24 - 1), nullable=False)
+    events = Column(LargeBinary(length=2**24 - 1), nullable=False)
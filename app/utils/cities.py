@@ -0,0 +1,124 @@
+import threading
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import func
+
+from app.models import db, CityLocations
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def unit_vectors(latitudes, longitudes):
+    """Points on the unit sphere, so chord length orders cities by great-circle distance."""
+    latitudes = np.radians(latitudes)
+    longitudes = np.radians(longitudes)
+    return np.column_stack(
+        (
+            np.cos(latitudes) * np.cos(longitudes),
+            np.cos(latitudes) * np.sin(longitudes),
+            np.sin(latitudes),
+        )
+    )
+
+
+class City:
+    """The CityLocations columns the sunrise views use, without the ORM."""
+
+    __slots__ = ("id", "city_name", "latitude", "longitude", "timezone")
+
+    def __init__(self, id, city_name, latitude, longitude, timezone):
+        self.id = id
+        self.city_name = city_name
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.timezone = timezone
+
+    def to_json(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class CityRegistry:
+    """Every stored city held in process, looked up by name or id.
+
+    The table is read once and then only re-read when its version, the
+    latest changed_on and the row count, moves on. The version is checked
+    at most every CITY_REGISTRY_TTL seconds, so lookups in between never
+    touch the database. A KD-tree over the cities' unit-sphere positions
+    answers nearest-city queries for raw coordinates.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        # (id -> City, city_name -> id, KD-tree, City per tree point), replaced whole on every load
+        self.index = ({}, {}, None, [])
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config["CITY_REGISTRY_TTL"]
+
+    def get(self, city_name):
+        self.refresh()
+        cities, ids, _, _ = self.index
+        city_id = ids.get(city_name)
+        return None if city_id is None else cities[city_id]
+
+    def get_by_id(self, city_id):
+        self.refresh()
+        return self.index[0].get(city_id)
+
+    def nearest(self, latitude, longitude, max_distance_km):
+        """(City, distance in km) for the closest city within max_distance_km, else None."""
+        self.refresh()
+        _, _, tree, points = self.index
+        if not points:
+            return None
+        max_chord = 2 * np.sin(min(max_distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+        chord, point = tree.query(
+            unit_vectors([latitude], [longitude])[0], distance_upper_bound=max_chord + 1e-12
+        )
+        if point == len(points):
+            return None
+        return points[point], float(2 * EARTH_RADIUS_KM * np.arcsin(min(chord / 2, 1.0)))
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.ttl:
+            return
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < self.ttl:
+                return
+            version = tuple(
+                db.session.query(
+                    func.max(CityLocations.changed_on), func.count(CityLocations.id)
+                ).one()
+            )
+            if version != self.version:
+                self.load(version)
+            self.checked_at = now
+
+    def load(self, version):
+        rows = db.session.query(
+            CityLocations.id,
+            CityLocations.city_name,
+            CityLocations.latitude,
+            CityLocations.longitude,
+            CityLocations.timezone,
+        )
+        cities = {row.id: City(*row) for row in rows}
+        points = list(cities.values())
+        tree = cKDTree(
+            unit_vectors(
+                [city.latitude for city in points], [city.longitude for city in points]
+            ).reshape(-1, 3)
+        )
+        self.index = (cities, {city.city_name: city.id for city in points}, tree, points)
+        self.version = version
+
+
+city_registry = CityRegistry()
@@ -1,13 +1,16 @@
-import sys
+from itertools import combinations
+
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-import scipy.optimize
-from skyfield.api import load, pi, tau
+from skyfield.api import pi, tau
+from skyfield.framelib import ecliptic_J2000_frame
 import plotly.graph_objects as go
 
-ts = load.timescale()
-eph = load("de421.bsp")
+from app.utils.ephemeris import FIRST_YEAR, LAST_YEAR, get_ephemeris, get_timescale
+from app.utils.sunrise_cache import LRUCache
+
+ts = get_timescale()
+eph = get_ephemeris()
 
 earth = eph["earth"]
 
@@ -20,15 +23,98 @@ objects = {
     "saturn": eph["saturn barycenter"],
 }
 object_name = ["sun", "mercury", "venus", "mars", "jupiter", "saturn"]
+# Every pair of objects, each ordered as in object_name
+PAIRS = list(combinations(object_name, 2))
+# Relative longitude, less this offset, is zero at each kind of event
+EVENT_OFFSETS = {"conjunction": 0.0, "opposition": pi}
+
+# Days between the longitude nodes of each body, one unless listed. Cubic
+# interpolation between nodes this close stays within LONGITUDE_ERROR_ARCSEC
+# of a direct observation; interpolation_error measures it
+NODE_DAYS = {"mercury": 0.5}
+LONGITUDE_ERROR_ARCSEC = 0.1
+# Nodes computed and cached together. Small enough that a block starting
+# before 1900 stays inside DE421
+BLOCK_NODES = 128
+
+conjunction_cache = LRUCache(max_entries=64, max_bytes=32 * 1024 * 1024)
+
+
+class LongitudeCache:
+    """Geocentric ecliptic longitudes interpolated from cached nodes.
+
+    Each body is observed at nodes NODE_DAYS apart, a block of BLOCK_NODES
+    at a time, and the unwrapped block is kept in an LRU. Longitudes at any
+    TT julian date come from a four-point cubic through the surrounding
+    nodes, so overlapping queries only ever observe a node once.
+    """
+
+    def __init__(self, max_entries=8192, max_bytes=64 * 1024 * 1024):
+        self.blocks = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+
+    def longitudes(self, body, jd):
+        """Longitudes of `body` in radians, in [0, tau), at TT julian dates `jd`."""
+        jd = np.asarray(jd, dtype=float)
+        if not jd.size:
+            return np.empty(jd.shape)
+        position = jd / NODE_DAYS.get(body, 1.0)
+        node = np.floor(position).astype(np.int64)
+        x = position - node
+        block_ids, block_rows = np.unique(node // BLOCK_NODES, return_inverse=True)
+        nodes = np.stack(self.load_blocks(body, block_ids))
+        # Block b holds nodes b * BLOCK_NODES - 1 to (b + 1) * BLOCK_NODES + 2
+        offset = node - block_ids[block_rows] * BLOCK_NODES + 1
+        p0, p1, p2, p3 = (nodes[block_rows, offset + shift] for shift in (-1, 0, 1, 2))
+        longitude = (
+            -x * (x - 1) * (x - 2) / 6 * p0
+            + (x + 1) * (x - 1) * (x - 2) / 2 * p1
+            - (x + 1) * x * (x - 2) / 2 * p2
+            + (x + 1) * x * (x - 1) / 6 * p3
+        )
+        return longitude.reshape(jd.shape) % tau
+
+    def load_blocks(self, body, block_ids):
+        blocks = [self.blocks.get((body, block_id)) for block_id in block_ids]
+        missing = [block_id for block_id, block in zip(block_ids, blocks) if block is None]
+        if missing:
+            # Observe every missing node in one call, then split it into blocks
+            offsets = np.arange(-1, BLOCK_NODES + 3)
+            node = (np.array(missing)[:, None] * BLOCK_NODES + offsets).ravel()
+            observed = observe_longitudes(body, node * NODE_DAYS.get(body, 1.0))
+            computed = dict(zip(missing, np.unwrap(observed.reshape(len(missing), -1), axis=1)))
+            for block_id, block in computed.items():
+                self.blocks.set((body, block_id), block)
+            blocks = [computed[block_id] if block is None else block
+                      for block_id, block in zip(block_ids, blocks)]
+        return blocks
+
+
+longitude_cache = LongitudeCache()
+
+
+def observe_longitudes(body, jd):
+    """Ecliptic longitudes in radians observed directly, without the cache."""
+    return earth.at(ts.tt_jd(jd)).observe(objects[body]).ecliptic_latlon()[1].radians
+
+
+def interpolation_error(body, start_year, end_year=None, samples=2000, seed=0):
+    """Largest difference in arcseconds between cached and observed longitudes.
+
+    Compares `samples` random times over the given whole years, to check a
+    body's NODE_DAYS against LONGITUDE_ERROR_ARCSEC.
+    """
+    end_year = start_year if end_year is None else end_year
+    jd = np.random.default_rng(seed).uniform(
+        ts.utc(start_year, 1, 1).tt, ts.utc(end_year + 1, 1, 1).tt, samples
+    )
+    difference = wrap_angle(longitude_cache.longitudes(body, jd) - observe_longitudes(body, jd))
+    return float(np.abs(difference).max() * 180 / pi * 3600)
 
 
 def relative_longitude(t, body_1, body_2):
     "Compute how far away in longitude the two celestial objects are."
-    e = earth.at(t)
-    lat, lon, distance = e.observe(objects[body_1]).ecliptic_latlon()
-    sl = lon.radians
-    lat, lon, distance = e.observe(objects[body_2]).ecliptic_latlon()
-    vl = lon.radians
+    sl = longitude_cache.longitudes(body_1, t.tt)
+    vl = longitude_cache.longitudes(body_2, t.tt)
     body_1_order = list(objects.keys()).index(body_1)
     body_2_order = list(objects.keys()).index(body_2)
     if body_1_order > body_2_order:
@@ -38,138 +124,332 @@ def relative_longitude(t, body_1, body_2):
     return relative_lon
 
 
-def calculate_conjunctions(year, body_1, body_2):
-    def validate_year(year):
-        okay = True
-        if isinstance(year, str):
-            okay = False
-            if year.isnumeric():
-                year = int(year)
-                okay = True
-        if okay and not 1900 <= year <= 2052:
-            okay = False
-        if not okay:
-            print("ERROR: Please pick a year between 1900 and 2052")
-            sys.exit(0)
-        return year
-    
-    yy = validate_year(str(year))
-
-    # Process monthly starting points spanning the chosen year
-    t = ts.utc(yy, range(13))
-
-    # Where in the sky were the two celestial objects on those dates?
-    
-    relative_lon = relative_longitude(t, body_1, body_2)
-
-    opp_ndx = []
-    conjunctions_per_year = []
-    oppositions_per_year = []
-    # Find where object B passed from being ahead of object A to being behind:
-    conjunctionsInf = (relative_lon >= 0)[:-1] & (relative_lon < 0)[1:]
-    # Find where object A passed from being ahead of object B to being behind:
-    conjunctionsSup = (relative_lon < 0)[:-1] & (relative_lon >= 0)[1:]
-    # ignore planets in opposition (only within conjunctionsSup) ...
-    for i in conjunctionsSup.nonzero()[0]:
-        if relative_lon[i+1] - relative_lon[i] > 5.0: 
-            opp_ndx.append(i)
-    # all conjunctions is the sum of both
-    conjunctions = conjunctionsInf + conjunctionsSup
-
-
-        # For each month that included a conjunction,
-        # ask SciPy exactly when the conjunction occurred.
-    for i in conjunctions.nonzero()[0]:
-        t0 = ts.tt(jd=t[i].tt)
-
-        t1 = ts.tt(jd=t[i + 1].tt)
-        # print("Starting search at", t0.utc_jpl())
-        jdt = scipy.optimize.brentq(
-            relative_longitude, t0, t1, args=(body_1, body_2)
-        )
-        tt = ts.tt(jd=jdt)
-        if i in opp_ndx:    # planets in opposition?
-            if "sun" in [body_1, body_2]:  # ignore if planet is not in opposition to the sun
-                # if j != 0 the planets are also theoretically "in opposition" in
-                # that their apparent geocentric celestial longitudes differ by 180°
-                oppositions_per_year.append((jdt, body_1, body_2))
-        else:
-            # append result as tuple to a list
-            conjunctions_per_year.append((jdt, body_1, body_2))
-
-    conjunctions_per_year.sort()  # sort tuples in-place by date
-    oppositions_per_year.sort()
-    
-    for jdt, body_1, body_2 in conjunctions_per_year:
-        print("Found conjunctions")
-        tt = ts.tt(jd=jdt)
-        # if int(tt.utc_strftime("%Y")) != yy: continue  # filter out incorrect years
-        print(
-            " {:7}-{:7}: {}".format(body_1, body_2, tt.utc_jpl())
-        )
+def wrap_angle(angle):
+    return (angle + pi) % tau - pi
+
+
+def ecliptic_longitudes(jd, bodies):
+    """Geocentric ecliptic longitudes in radians at TT julian dates, one row per body."""
+    return np.array([longitude_cache.longitudes(body, jd) for body in bodies])
+
 
-    for jdt, body_1, body_2 in oppositions_per_year:
-        print("Found oppositions")
-        tt = ts.tt(jd=jdt)
-        # if int(tt.utc_strftime("%Y")) != yy: continue  # filter out incorrect years
-        print(
-            " {:7}-{:7}: {}".format(body_1, body_2, tt.utc_jpl())
+def pair_longitudes(jd, first, second, bodies):
+    """Longitudes of each bracket's two bodies at that bracket's TT julian date."""
+    longitudes = np.empty((2, len(jd)))
+    for index, body in enumerate(bodies):
+        for row, members in enumerate((first, second)):
+            mask = members == index
+            if mask.any():
+                longitudes[row, mask] = longitude_cache.longitudes(body, jd[mask])
+    return longitudes
+
+
+def find_conjunctions(start_year, end_year=None, pairs=None, step_days=1.0, tolerance_days=1e-7):
+    """Conjunctions and oppositions of every pair over whole years, as a DataFrame.
+
+    The longitudes of every body involved are read from longitude_cache on a
+    shared grid of `step_days`. Sign changes of each pair's relative
+    longitude bracket the events, and all brackets are then bisected
+    together until they are narrower than `tolerance_days`. Oppositions are
+    only reported for pairs that include the sun.
+    """
+    end_year = start_year if end_year is None else end_year
+    if not FIRST_YEAR <= start_year <= end_year <= LAST_YEAR:
+        raise ValueError(f"Years must lie between {FIRST_YEAR} and {LAST_YEAR}")
+    pairs = PAIRS if pairs is None else pairs
+    bodies = sorted({body for pair in pairs for body in pair}, key=object_name.index)
+    first = np.array([bodies.index(min(pair, key=object_name.index)) for pair in pairs])
+    second = np.array([bodies.index(max(pair, key=object_name.index)) for pair in pairs])
+
+    start_jd = ts.utc(start_year, 1, 1).tt
+    end_jd = ts.utc(end_year + 1, 1, 1).tt
+    grid = np.append(np.arange(start_jd, end_jd, step_days), end_jd)
+    longitudes = ecliptic_longitudes(grid, bodies)
+    relative = longitudes[second] - longitudes[first]
+
+    pair_index, step_index, events = [], [], []
+    for event, offset in EVENT_OFFSETS.items():
+        candidates = np.arange(len(pairs))
+        if offset:
+            candidates = np.array([i for i, pair in enumerate(pairs) if "sun" in pair], dtype=int)
+        angle = wrap_angle(relative[candidates] - offset)
+        # A sign change is an event unless the angle wrapped round at +-pi instead
+        crossing = ((angle[:, :-1] < 0) != (angle[:, 1:] < 0)) & (
+            np.abs(angle[:, 1:] - angle[:, :-1]) < pi
         )
+        rows, steps = crossing.nonzero()
+        pair_index.append(candidates[rows])
+        step_index.append(steps)
+        events.append(np.full(len(rows), event))
+    pair_index = np.concatenate(pair_index)
+    step_index = np.concatenate(step_index)
+    events = np.concatenate(events)
+    offsets = np.array([EVENT_OFFSETS[event] for event in events])
+
+    low = grid[step_index]
+    high = grid[step_index + 1]
+    low_negative = wrap_angle(relative[pair_index, step_index] - offsets) < 0
+    pair_first = first[pair_index]
+    pair_second = second[pair_index]
+    while len(low) and (high - low).max() > tolerance_days:
+        middle = (low + high) / 2
+        middle_longitudes = pair_longitudes(middle, pair_first, pair_second, bodies)
+        middle_negative = wrap_angle(middle_longitudes[1] - middle_longitudes[0] - offsets) < 0
+        # Keep whichever half still has a sign change
+        upper = middle_negative == low_negative
+        low = np.where(upper, middle, low)
+        high = np.where(upper, high, middle)
+    jd = (low + high) / 2
+
+    order = np.argsort(jd, kind="stable")
+    return pd.DataFrame(
+        {
+            "TT": jd[order],
+            "Time": pd.to_datetime(ts.tt_jd(jd[order]).utc_datetime()) if len(jd) else [],
+            "Event": events[order],
+            "Body 1": [pairs[i][0] for i in pair_index[order]],
+            "Body 2": [pairs[i][1] for i in pair_index[order]],
+        }
+    )
+
+
+def parse_year(year):
+    """An int year from an int or numeric string, within the DE421 span."""
+    if isinstance(year, str) and year.strip().isnumeric():
+        year = int(year)
+    if not isinstance(year, int) or not FIRST_YEAR <= year <= LAST_YEAR:
+        raise ValueError(f"Pick a year between {FIRST_YEAR} and {LAST_YEAR}")
+    return year
+
+
+def parse_pairs(pairs):
+    """Distinct known pairs, each ordered as in object_name, in PAIRS order."""
+    if pairs is None:
+        return tuple(PAIRS)
+    ordered = set()
+    for pair in pairs:
+        if len(pair) != 2 or pair[0] == pair[1] or not set(pair) <= set(object_name):
+            raise ValueError(f"Unknown pair of objects {pair}, pick two of {', '.join(object_name)}")
+        ordered.add(tuple(sorted(pair, key=object_name.index)))
+    if not ordered:
+        raise ValueError("Pick at least one pair of objects")
+    return tuple(pair for pair in PAIRS if pair in ordered)
+
+
+def add_separations(table):
+    """Angular separation in degrees of each event's two bodies at its time."""
+    separations = np.empty(len(table))
+    for (body_1, body_2), rows in table.groupby(["Body 1", "Body 2"]).indices.items():
+        e = earth.at(ts.tt_jd(table["TT"].to_numpy()[rows]))
+        separations[rows] = e.observe(objects[body_1]).separation_from(
+            e.observe(objects[body_2])
+        ).degrees
+    table["Separation"] = separations
+    return table
+
+
+def calculate_conjunctions(start_year, end_year=None, pairs=None):
+    """Conjunctions and oppositions over whole years, as a DataFrame.
+
+    Each row has the event's TT julian date and UTC time, the two bodies,
+    the kind of event and the bodies' angular separation in degrees.
+    `pairs` defaults to every pair of objects. Bad years or bodies raise
+    ValueError. Results are cached per year range and set of pairs; the
+    caller gets its own copy.
+    """
+    start_year = parse_year(start_year)
+    end_year = start_year if end_year is None else parse_year(end_year)
+    if end_year < start_year:
+        raise ValueError("The end year must not be before the start year")
+    key = (start_year, end_year, parse_pairs(pairs))
+    table = conjunction_cache.get(key)
+    if table is None:
+        table = add_separations(find_conjunctions(start_year, end_year, list(key[2])))
+        conjunction_cache.set(key, table)
+    return table.copy()
+
+
+def parse_body(body):
+    if body not in objects:
+        raise ValueError(f"Unknown object {body}, pick one of {', '.join(object_name)}")
+    return body
+
+
+def longitude_rates(body, jd):
+    """Rate of change of ecliptic longitude in radians per day, from skyfield."""
+    position = earth.at(ts.tt_jd(jd)).observe(objects[body])
+    return position.frame_latlon_and_rates(ecliptic_J2000_frame)[4].radians.per_day
+
+
+def find_stations(body, start_year, end_year=None, tolerance_days=1e-6):
+    """Stations of a body over whole years, as a DataFrame.
+
+    A station is where the body's ecliptic longitude stops moving and turns:
+    "retrograde" when it starts moving backwards and "direct" when it resumes.
+    Daily cached longitudes bracket every turn, and the brackets are bisected
+    together on skyfield's longitude rate until narrower than `tolerance_days`.
+    The sun never stations, so it gives an empty table.
+    """
+    body = parse_body(body)
+    start_year = parse_year(start_year)
+    end_year = start_year if end_year is None else parse_year(end_year)
+    if end_year < start_year:
+        raise ValueError("The end year must not be before the start year")
+    start_jd = ts.utc(start_year, 1, 1).tt
+    end_jd = ts.utc(end_year + 1, 1, 1).tt
+    # A day either side so stations right at the ends are still bracketed
+    grid = np.arange(start_jd - 1, end_jd + 2)
+    motion = np.diff(np.unwrap(longitude_cache.longitudes(body, grid)))
+    turns = np.nonzero((motion[:-1] < 0) != (motion[1:] < 0))[0]
+    low = grid[turns]
+    high = grid[turns + 2]
+    low_negative = motion[turns] < 0
+    while len(low) and (high - low).max() > tolerance_days:
+        middle = (low + high) / 2
+        upper = (longitude_rates(body, middle) < 0) == low_negative
+        low = np.where(upper, middle, low)
+        high = np.where(upper, high, middle)
+    jd = (low + high) / 2
+    inside = (jd >= start_jd) & (jd < end_jd)
+    jd = jd[inside]
+    return pd.DataFrame(
+        {
+            "TT": jd,
+            "Time": pd.to_datetime(ts.tt_jd(jd).utc_datetime()) if len(jd) else [],
+            "Station": np.where(low_negative[inside], "direct", "retrograde"),
+            "Longitude": longitude_cache.longitudes(body, jd) * 180 / pi,
+        }
+    )
+
+
+def retrograde_intervals(body, start_year, end_year=None):
+    """Each spell of retrograde motion over whole years, as a DataFrame of intervals.
+
+    Spells already under way at the start, or not over by the end, are cut
+    off at the range's ends.
+    """
+    stations = find_stations(body, start_year, end_year)
+    end_year = start_year if end_year is None else end_year
+    start_jd = ts.utc(parse_year(start_year), 1, 1).tt
+    end_jd = ts.utc(parse_year(end_year) + 1, 1, 1).tt
+    starts = stations.loc[stations["Station"] == "retrograde", "TT"].to_numpy()
+    ends = stations.loc[stations["Station"] == "direct", "TT"].to_numpy()
+    if len(ends) and (not len(starts) or ends[0] < starts[0]):
+        starts = np.insert(starts, 0, start_jd)
+    if len(starts) > len(ends):
+        ends = np.append(ends, end_jd)
+    return pd.DataFrame(
+        {
+            "Start": pd.to_datetime(ts.tt_jd(starts).utc_datetime()) if len(starts) else [],
+            "End": pd.to_datetime(ts.tt_jd(ends).utc_datetime()) if len(ends) else [],
+            "Start longitude": longitude_cache.longitudes(body, starts) * 180 / pi,
+            "End longitude": longitude_cache.longitudes(body, ends) * 180 / pi,
+        }
+    )
+
+
+def min_max_indices(values, buckets):
+    """Indices of the first, last, lowest and highest value in each of `buckets` equal slices.
+
+    Keeping the extremes of every slice preserves the shape of the line,
+    stations included, at a few points per bucket.
+    """
+    count = len(values)
+    if count <= 4 * buckets:
+        return np.arange(count)
+    bucket = np.arange(count) * buckets // count
+    # Sorted by bucket first, so each bucket's run starts at the same place in both
+    order = np.lexsort((values, bucket))
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    ends = np.append(starts[1:], count) - 1
+    return np.unique(np.concatenate((starts, ends, order[starts], order[ends])))
+
+
+def wrapped_segments(days, degrees):
+    """Split a longitude series in degrees wherever it wraps past 0/360.
+
+    Returns the (days, degrees) segments and the days of each wrap. Both
+    sides of a wrap get the interpolated point where it crosses, so each
+    segment runs right up to the edge of the chart.
+    """
+    wraps = np.nonzero(np.abs(np.diff(degrees)) > 180)[0]
+    forward = degrees[wraps + 1] < degrees[wraps]
+    edge = np.where(forward, 360.0, 0.0)
+    following = degrees[wraps + 1] + np.where(forward, 360.0, -360.0)
+    crossing = days[wraps] + (edge - degrees[wraps]) / (following - degrees[wraps])
+    bounds = np.concatenate(([0], wraps + 1, [len(days)]))
+    segments = []
+    for index in range(len(bounds) - 1):
+        x = days[bounds[index]:bounds[index + 1]]
+        y = degrees[bounds[index]:bounds[index + 1]]
+        if index > 0:
+            x = np.insert(x, 0, crossing[index - 1])
+            y = np.insert(y, 0, 360.0 - edge[index - 1])
+        if index < len(wraps):
+            x = np.append(x, crossing[index])
+            y = np.append(y, edge[index])
+        segments.append((x, y))
+    return segments, crossing
+
+
+def calculate_retrogrades(year_zero, body, years=20, max_points=2000):
+    """Plotly figure of a body's longitude over `years`, with retrograde spells shaded.
+
+    The line is split into one trace per lap of the ecliptic, so no NaN
+    padding is needed, and a line marks each wrap past 0/360. With
+    `max_points` set, each trace keeps only the first, last, lowest and
+    highest day of equal slices, so the figure stays about that size for
+    any range; None keeps every day. Spells come from retrograde_intervals
+    and all shapes are set in one layout update.
+    """
+    body = parse_body(body)
+    if not isinstance(years, int) or years < 1:
+        raise ValueError("Pick at least one year")
+    start_year = parse_year(year_zero)
+    end_year = parse_year(start_year + years - 1)
+    start = np.datetime64(f"{start_year:04d}-01-01")
+    day_count = int((np.datetime64(f"{end_year + 1:04d}-01-01") - start).astype(int))
+    t = ts.utc(start_year, 1, np.arange(1, day_count + 1))
+    degrees = longitude_cache.longitudes(body, t.tt) * 180 / pi
+    segments, wraps = wrapped_segments(np.arange(day_count, dtype=float), degrees)
 
+    def to_dates(days):
+        return start + (days * 86400).astype("timedelta64[s]")
 
-def calculate_retrogrades(year_zero, body):
-    days = 7300
-    base = datetime.strptime(str(year_zero), "%Y")
-    years = [base + timedelta(days=x) for x in range(days)]
-    ts = load.timescale()
-    t = ts.utc(year_zero, 1, np.linspace(1, days, days))
-    
-    # thanks to @barrycarter's comment, do it the right way!
-    eclat, eclon, ecd = earth.at(t).observe(objects[body]).ecliptic_latlon()
-    
-    eclondgs = (180./np.pi) * eclon.radians
-    eclondel = eclondgs[1:] - eclondgs[:-1]
-    
-    eclondel[eclondel < -300] += 360. # this is a fudge for now
-    eclondel[eclondel > +300] -= 360. # this is a fudge for now
-    
-    prograde   = eclondel > 0.
-    
-    eclon_prograde   = eclondgs.copy()[:-1]
-    eclon_retrograde = eclondgs.copy()[:-1]
-    
-    eclon_prograde[~prograde]  = np.nan
-    eclon_retrograde[prograde] = np.nan
-    
-    prograde = pd.DataFrame(data={"Year": years[:-1], "Position": eclon_prograde})
-    prograde["Type"] = "Prograde"
-    retrograde = pd.DataFrame(data={"Year": years[:-1], "Position": eclon_retrograde})
-    retrograde["Type"] = "Retrograde"
-    
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter(
-        x=prograde["Year"],
-        y=prograde["Position"],
-        mode="lines",
-        hovertemplate="Type: Prograde<br>Date: %{x|%d-%b-%Y}<br>Position: %{y}"
-    ))
-    fig.add_trace(go.Scatter(
-        x=retrograde["Year"],
-        y=retrograde["Position"],
-        mode="lines",
-        hovertemplate="Type: Retrograde<br>Date: %{x|%d-%b-%Y}<br>Position: %{y}"
-    ))
-    
-    # data = pd.concat([prograde, retrograde])
-    
-    # fig = px.line(data, x="Year", y="Position", color="Type", template="simple_white")
-    # # fig.update_traces(hovertemplate="Date: %{x|%d-%b-%Y}<br>Position: %{y}<br>Type: %{color}")
+    traces = []
+    for index, (days, positions) in enumerate(segments):
+        if max_points:
+            keep = min_max_indices(positions, max(1, max_points * len(days) // day_count // 4))
+            days, positions = days[keep], positions[keep]
+        traces.append(go.Scatter(
+            x=to_dates(days),
+            y=positions,
+            mode="lines",
+            name="Position",
+            legendgroup="Position",
+            showlegend=index == 0,
+            line={"color": "#1f77b4"},
+            hovertemplate="Date: %{x|%d-%b-%Y}<br>Position: %{y}"
+        ))
+    shapes = [
+        {
+            "type": "rect", "xref": "x", "yref": "paper", "y0": 0, "y1": 1,
+            "x0": spell.Start.tz_convert(None), "x1": spell.End.tz_convert(None),
+            "fillcolor": "#440154", "opacity": 0.2, "line": {"width": 0}, "layer": "below",
+        }
+        for spell in retrograde_intervals(body, start_year, end_year).itertuples()
+    ] + [
+        {
+            "type": "line", "xref": "x", "yref": "paper", "y0": 0, "y1": 1,
+            "x0": date, "x1": date, "line": {"width": 4},
+        }
+        for date in to_dates(wraps)
+    ]
+    fig = go.Figure(data=traces)
     fig.update_layout(
         yaxis_range=[0,360],
         hovermode="x unified",
-        template="simple_white"
+        template="simple_white",
+        shapes=shapes,
     )
-    rotation_dates = prograde.loc[prograde["Position"] < 1, "Year"]
-    [fig.add_vline(x=date, line_width=4) for date in rotation_dates]
-    return fig
\ No newline at end of file
+    return fig
@@ -0,0 +1,43 @@
+import threading
+
+from skyfield.api import load
+
+EPHEMERIS_FILE = "de421.bsp"
+# Whole years inside the DE421 span (1899-07-29 to 2053-10-09)
+FIRST_YEAR = 1900
+LAST_YEAR = 2052
+
+lock = threading.Lock()
+loaded = {}
+
+
+def get_timescale():
+    with lock:
+        if "timescale" not in loaded:
+            loaded["timescale"] = load.timescale()
+        return loaded["timescale"]
+
+
+def get_ephemeris():
+    """The process-wide DE421 kernel.
+
+    jplephem memory-maps each segment of the BSP file read-only the first time
+    it is used, so every process reading the kernel shares the same pages.
+    """
+    with lock:
+        if "eph" not in loaded:
+            loaded["eph"] = load(EPHEMERIS_FILE)
+        return loaded["eph"]
+
+
+def preload():
+    """Load the timescale and map every ephemeris segment up front.
+
+    Called from the gunicorn master before workers fork, so the workers
+    inherit the loaded objects and the mapped pages instead of repeating
+    the work.
+    """
+    get_timescale()
+    eph = get_ephemeris()
+    for segment in eph.spk.segments:
+        segment.compute(segment.start_jd)
@@ -1,24 +1,509 @@
-from pytz import timezone
+import json
 from datetime import datetime, timedelta
 from skyfield import almanac
-from skyfield.api import N, E, wgs84, load
+from skyfield.api import N, E, wgs84
+from skyfield.nutationlib import iau2000b_radians
+import numpy as np
 import pandas as pd
-from timezonefinder import TimezoneFinder
 import altair as alt
 from altair import datum
 
+from app.utils.ephemeris import get_ephemeris, get_timescale
+from app.utils.sunrise_cache import sunrise_cache
+from app.utils.timezones import city_timezone
+from app.utils.twilight_store import load_twilight_events, save_twilight_events
+
+DAWN_EVENTS = np.array(
+    [almanac.TWILIGHTS[code].replace("twilight", "dawn") for code in sorted(almanac.TWILIGHTS)]
+)
+DUSK_EVENTS = np.char.replace(DAWN_EVENTS, "dawn", "dusk")
+NEXT_DAY_EVENTS = np.char.replace(DUSK_EVENTS, "dusk", "dawn+1")
+# Every sunrise_data event label, indexed by the uint8 codes TwilightYear stores
+EVENT_NAMES = np.array(list(dict.fromkeys([*DAWN_EVENTS, *DUSK_EVENTS, *NEXT_DAY_EVENTS])))
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_NAMES)}
+DAWN_CODES = np.array([EVENT_CODES[name] for name in DAWN_EVENTS], dtype=np.uint8)
+DUSK_CODES = np.array([EVENT_CODES[name] for name in DUSK_EVENTS], dtype=np.uint8)
+NEXT_DAY_CODES = np.array([EVENT_CODES[name] for name in NEXT_DAY_EVENTS], dtype=np.uint8)
+# Phase each event belongs to, e.g. "Civil" for civil dawn, dusk and dawn+1
+EVENT_PHASES = np.array([name.split(" ")[0] for name in EVENT_NAMES])
+HALF_MICROSECOND = 0.5e-6 / 86400
+MIN_TIME = datetime(1900, 1, 1, 0, 0)
+MAX_TIME = datetime(1900, 1, 1, 23, 59, 59)
+MAX_SECONDS = 86399
+DAY_SECONDS = 86400.0
+# Sun altitudes separating the almanac.TWILIGHTS codes, as in dark_twilight_day
+TWILIGHT_ALTITUDES = np.array([-18.0, -12.0, -6.0, -0.8333])
+# Vega parameter the client sets to move the date line on the year chart
+SELECTED_DATE_PARAM = "selected_date"
+# Longest date range, in calendar years, one chart may cover
+MAX_RANGE_YEARS = 5
+# WGS84 equatorial radius, for the sun's horizontal parallax
+EARTH_EQUATORIAL_RADIUS_KM = 6378.137
+
+
+def background():
+    theme = {
+        "config": {
+            "view": {"height": 300, "width": 300, "fill": "#39304A"},
+            "title": {
+                "anchor": "start",
+                "dy": -15,
+                "fontSize": 24,
+                "fontWeight": 600,
+                "color": "#2f5275",
+            },
+            "area": {"fill": "#909090"},
+        }
+    }
+    return theme
+
+
+# Enabled at import so charts built from a cached spec get the same theme
+alt.themes.register("background", background)
+alt.themes.enable("background")
+
+
+def find_twilight_transitions(eph, location, t0, t1, precision=1.0, step_days=0.04):
+    """Find dark/twilight/day transitions between t0 and t1.
+
+    Returns the same (times, events) as almanac.find_discrete with
+    almanac.dark_twilight_day, but samples the sun's altitude over the whole
+    range in one batched call and then refines every threshold crossing
+    together, so each iteration is a single Skyfield call. Times are
+    accurate to within `precision` seconds.
+    """
+    timescale = t0.ts
+    sun = eph["sun"]
+    observer = eph["earth"] + location
+
+    def altitude(jd, rows=None):
+        t = timescale.tt_jd(jd)
+        # Same cheaper nutation model dark_twilight_day uses
+        t._nutation_angles_radians = iau2000b_radians(t)
+        return observer.at(t).observe(sun).apparent().altaz()[0].degrees
+
+    steps = max(int(np.ceil((t1.tt - t0.tt) / step_days)), 1)
+    grid = np.linspace(t0.tt, t1.tt, steps + 1)
+    _, times, events = find_crossings(altitude, grid, altitude(grid)[np.newaxis], precision)
+    return timescale.tt_jd(times), events
+
+
+def find_twilight_transitions_batch(
+    eph, latitudes, longitudes, t0, t1, precision=1.0, step_days=0.04
+):
+    """Find twilight transitions for many observers in one pass.
+
+    `latitudes` and `longitudes` are in degrees and `t0`/`t1` are Time arrays
+    holding each observer's own range. The sun's geocentric position is
+    computed once on a shared grid and every observer's altitude follows from
+    it with NumPy, interpolating the sun's coordinates during refinement.
+    Altitudes are corrected for the sun's horizontal parallax and stay within
+    0.2 arcseconds of find_twilight_transitions, so the same transitions are
+    found at times that agree to about `precision`. Grazing crossings, where
+    the sun only just passes a threshold near midsummer or midwinter at high
+    latitudes, move further, about two seconds at worst for stored cities.
+    Returns a list of (times, events) per observer.
+    """
+    timescale = t0.ts
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))
+
+    steps = max(int(np.ceil((t1.tt.max() - t0.tt.min()) / step_days)), 1)
+    grid = np.linspace(t0.tt.min(), t1.tt.max(), steps + 1)
+    t = timescale.tt_jd(grid)
+    t._nutation_angles_radians = iau2000b_radians(t)
+    right_ascension, declination, distance = (
+        eph["earth"].at(t).observe(eph["sun"]).apparent().radec(epoch="date")
+    )
+    # Greenwich hour angle of the sun, unwrapped so it interpolates smoothly
+    hour_angles = np.unwrap(t.gast * np.pi / 12 - right_ascension.radians)
+    declinations = declination.radians
+    parallaxes = np.arcsin(EARTH_EQUATORIAL_RADIUS_KM / distance.km)
+
+    def sun_altitude(hour_angle, declination, parallax, rows):
+        sin_altitude = np.sin(latitudes[rows]) * np.sin(declination) + np.cos(
+            latitudes[rows]
+        ) * np.cos(declination) * np.cos(hour_angle + longitudes[rows])
+        altitude = np.arcsin(sin_altitude)
+        # Seen from the surface the sun sits lower than from the earth's centre
+        return np.degrees(altitude - parallax * np.cos(altitude))
+
+    def altitude(jd, rows):
+        return sun_altitude(
+            np.interp(jd, grid, hour_angles),
+            np.interp(jd, grid, declinations),
+            np.interp(jd, grid, parallaxes),
+            rows,
+        )
+
+    all_rows = np.arange(len(latitudes))[:, np.newaxis]
+    altitudes = sun_altitude(hour_angles, declinations, parallaxes, all_rows)
+    rows, times, events = find_crossings(altitude, grid, altitudes, precision)
+
+    in_range = (times >= t0.tt[rows]) & (times < t1.tt[rows])
+    rows, times, events = rows[in_range], times[in_range], events[in_range]
+    bounds = np.searchsorted(rows, np.arange(len(latitudes) + 1))
+    return [
+        (timescale.tt_jd(times[start:end]), events[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def find_crossings(altitude, grid, altitudes, precision):
+    """Find when each row of sampled altitudes crosses TWILIGHT_ALTITUDES.
+
+    `altitudes` has one row per observer sampled at the `grid` julian dates,
+    and `altitude(jd, rows)` evaluates the given observers at any times.
+    Returns (rows, times, events) sorted by row and then time, with events
+    holding the almanac.TWILIGHTS code that starts at each crossing.
+    """
+    row_count, sample_count = altitudes.shape
+    sample_rows = np.repeat(np.arange(row_count), sample_count)
+    sample_times = np.tile(grid, row_count)
+    sample_altitudes = altitudes.ravel()
+
+    # Adding each daily high and low to the grid brackets brief dips below a
+    # threshold that fall between two samples, e.g. around midsummer
+    extrema_rows, extrema = altitude_extrema(grid, altitudes)
+    if len(extrema):
+        positions = extrema_rows * sample_count + np.searchsorted(grid, extrema)
+        sample_rows = np.insert(sample_rows, positions, extrema_rows)
+        sample_times = np.insert(sample_times, positions, extrema)
+        sample_altitudes = np.insert(
+            sample_altitudes, positions, altitude(extrema, extrema_rows)
+        )
+
+    above = sample_altitudes >= TWILIGHT_ALTITUDES[:, np.newaxis]
+    same_row = sample_rows[1:] == sample_rows[:-1]
+    levels, index = np.nonzero((above[:, 1:] != above[:, :-1]) & same_row)
+    rising = above[levels, index + 1]
+    rows = sample_rows[index]
+    targets = TWILIGHT_ALTITUDES[levels]
+
+    # Illinois false position on all brackets at once
+    lo, hi = sample_times[index], sample_times[index + 1]
+    f_lo = sample_altitudes[index] - targets
+    f_hi = sample_altitudes[index + 1] - targets
+    # Degrees per day across the initial bracket, to turn residuals into seconds
+    slope = np.abs(f_hi - f_lo) / (hi - lo)
+    root = hi.copy()
+    pending = np.ones(len(root), dtype=bool)
+    for _ in range(50):
+        if not pending.any():
+            break
+        root[pending] = (lo * f_hi - hi * f_lo)[pending] / (f_hi - f_lo)[pending]
+        f_root = np.zeros(len(root))
+        f_root[pending] = altitude(root[pending], rows[pending]) - targets[pending]
+        converged = np.abs(f_root) / slope * DAY_SECONDS < precision / 2
+        converged |= (hi - lo) * DAY_SECONDS < precision
+        pending &= ~converged
+        same_side = np.signbit(f_root) == np.signbit(f_lo)
+        moves_lo = pending & same_side
+        moves_hi = pending & ~same_side
+        f_hi = np.where(moves_lo, f_hi / 2, f_hi)
+        f_lo = np.where(moves_hi, f_lo / 2, f_lo)
+        lo, f_lo = np.where(moves_lo, root, lo), np.where(moves_lo, f_root, f_lo)
+        hi, f_hi = np.where(moves_hi, root, hi), np.where(moves_hi, f_root, f_hi)
+
+    # Crossing threshold k upwards starts code k + 1, downwards starts code k
+    order = np.lexsort((root, rows))
+    return rows[order], root[order], (levels + rising)[order]
+
+
+def altitude_extrema(grid, altitudes):
+    """Estimate when each local high or low between grid samples occurs.
+
+    Returns the row of `altitudes` and the julian date of each turn.
+    """
+    before, middle, after = altitudes[:, :-2], altitudes[:, 1:-1], altitudes[:, 2:]
+    curvature = before - 2 * middle + after
+    turning = np.signbit(middle - before) != np.signbit(after - middle)
+    rows, index = np.nonzero(turning & (curvature != 0))
+    step = grid[index + 2] - grid[index + 1]
+    # Vertex of the parabola through the three samples around each turn
+    offset = step * (before[rows, index] - after[rows, index]) / (
+        2 * curvature[rows, index]
+    )
+    return rows, grid[index + 1] + np.clip(offset, -step, step)
+
+
+def compute_twilight_batch(cities, year, precision=1.0):
+    """Sunrise data for many cities and one year as a long-format DataFrame.
+
+    `cities` are CityLocations.to_json() dicts. The result has the columns of
+    SunriseGraph.sunrise_data plus a leading "City" column.
+    """
+    timescale = get_timescale()
+    eph = get_ephemeris()
+    timezones = [city_timezone(city) for city in cities]
+    transitions, t1 = find_city_year_transitions(
+        eph, timescale, cities, timezones, year, precision
+    )
+    t0 = timescale.from_datetimes(
+        [year_bounds(city_timezone, year)[0] for city_timezone in timezones]
+    )
+
+    sunrise_frames = []
+    for index, (city, (times, events)) in enumerate(zip(cities, transitions)):
+        location = wgs84.latlon(float(city["latitude"]) * N, float(city["longitude"]) * E)
+        twilight_phases = almanac.dark_twilight_day(eph, location)
+        times, events = with_initial_state(twilight_phases, t0[index], times, events)
+        twilight_year = build_twilight_year(times, events, t1[index], timezones[index], year)
+        sunrise_df = twilight_year.to_frame()
+        sunrise_df.insert(0, "City", city["city_name"])
+        sunrise_frames.append(sunrise_df)
+    return pd.concat(sunrise_frames, ignore_index=True)
+
+
+def find_city_year_transitions(eph, timescale, cities, timezones, year, precision=1.0):
+    """Batch transitions for each city over its local calendar year.
+
+    Returns the per-city (times, events) list and the Time array of each
+    city's year end, which build_twilight_year needs.
+    """
+    bounds = [year_bounds(city_timezone, year) for city_timezone in timezones]
+    t0 = timescale.from_datetimes([min_date for min_date, _ in bounds])
+    t1 = timescale.from_datetimes([max_date for _, max_date in bounds])
+    transitions = find_twilight_transitions_batch(
+        eph,
+        [float(city["latitude"]) for city in cities],
+        [float(city["longitude"]) for city in cities],
+        t0,
+        t1,
+        precision,
+    )
+    return transitions, t1
+
+
+def year_bounds(city_timezone, year):
+    """Local midnight on 1 January of `year` and of the year after."""
+    min_date = city_timezone.localize(datetime(year, 1, 1))
+    max_date = city_timezone.localize(datetime(year + 1, 1, 1))
+    return min_date, max_date
+
+
+def with_initial_state(twilight_phases, t0, times, events):
+    """Prepend the twilight state at t0 to transitions found after it.
+
+    Without it a year's rows start at its first transition, leaving a gap
+    after midnight on 1 January where consecutive years meet.
+    """
+    timescale = t0.ts
+    times = timescale.tt_jd(
+        np.append(t0.whole, times.whole), np.append(t0.tt_fraction, times.tt_fraction)
+    )
+    return times, np.append(twilight_phases(t0), events)
+
+
+def build_twilight_year(times, events, t1, city_timezone, year):
+    """Turn twilight transitions into one row per event per calendar date."""
+    events = np.asarray(events, dtype=int)
+
+    # Each event runs from its own start to the start of the next event
+    starts = local_times(times, city_timezone)
+    ends = starts[1:].append(local_times(t1, city_timezone))
+    start_dates = starts.normalize()
+    end_dates = ends.normalize()
+    dusk = starts.hour > 12
+    start_events = np.where(dusk, DUSK_CODES[events], DAWN_CODES[events])
+    end_events = np.where(dusk, NEXT_DAY_CODES[events], DAWN_CODES[events])
+
+    # Events crossing midnight are split into one row per calendar date:
+    # the partial first and last days plus a whole-day row for each between
+    day_counts = (end_dates - start_dates).days.to_numpy()
+    rows_per_event = day_counts + 1
+    event_index = np.repeat(np.arange(len(events)), rows_per_event)
+    first_row = np.cumsum(rows_per_event) - rows_per_event
+    row_offset = np.arange(len(event_index)) - np.repeat(first_row, rows_per_event)
+    is_first_day = row_offset == 0
+    is_last_day = row_offset == rows_per_event[event_index] - 1
+    spans_days = day_counts[event_index] > 0
+
+    origin = np.datetime64(f"{year}-01-01", "D")
+    first_days = (start_dates.to_numpy().astype("datetime64[D]") - origin).astype(int)
+    start_seconds = (starts - start_dates).to_numpy() // np.timedelta64(1, "s")
+    end_seconds = (ends - end_dates).to_numpy() // np.timedelta64(1, "s")
+    days = first_days[event_index] + row_offset
+    # Drop the empty row the last event leaves at midnight on the next 1 January
+    year_days = (np.datetime64(f"{year + 1}-01-01", "D") - origin).astype(int)
+    in_year = (days >= 0) & (days < year_days)
+    return TwilightYear(
+        year,
+        days=days[in_year],
+        events=np.where(
+            is_last_day & spans_days, end_events[event_index], start_events[event_index]
+        )[in_year],
+        starts=np.where(is_first_day, start_seconds[event_index], 0)[in_year],
+        ends=np.where(is_last_day, end_seconds[event_index], MAX_SECONDS)[in_year],
+    )
+
+
+class TwilightYear:
+    """One city's twilight rows for local calendar years as NumPy arrays.
+
+    Row i is event code `events[i]` (see EVENT_NAMES) on day `days[i]`,
+    counted from 1 January of `year`, running from `starts[i]` to `ends[i]`
+    seconds after local midnight. Rows are in date order and `day_rows`
+    holds where each day's rows begin, so a date's rows are one slice.
+
+    Daylight seconds for every day and the rows of each event are worked out
+    once here, so per-date summaries and per-event charts never scan.
+    Consecutive years are combined with join().
+    """
+
+    def __init__(self, year, days, events, starts, ends):
+        self.year = year
+        self.origin = np.datetime64(f"{year}-01-01", "D")
+        self.days = np.asarray(days, dtype=np.int16)
+        self.events = np.asarray(events, dtype=np.uint8)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+        self.first_day = int(self.days[0]) if len(self.days) else 0
+        last_day = int(self.days[-1]) if len(self.days) else -1
+        self.day_rows = np.searchsorted(
+            self.days, np.arange(self.first_day, last_day + 2)
+        ).astype(np.int32)
+
+        is_day = self.events == EVENT_CODES["Day"]
+        self.day_lengths = np.bincount(
+            self.days[is_day] - self.first_day,
+            weights=(self.ends - self.starts)[is_day],
+            minlength=len(self.day_rows) - 1,
+        ).astype(np.int32)
+        self.event_order = np.argsort(self.events, kind="stable").astype(np.int32)
+        self.event_offsets = np.searchsorted(
+            self.events[self.event_order], np.arange(len(EVENT_NAMES) + 1)
+        ).astype(np.int32)
+
+    @classmethod
+    def join(cls, segments):
+        """Concatenate consecutive TwilightYears, counting days from the first."""
+        if len(segments) == 1:
+            return segments[0]
+        first = segments[0]
+        day_shifts = [(segment.origin - first.origin).astype(int) for segment in segments]
+        return cls(
+            first.year,
+            days=np.concatenate([
+                segment.days.astype(int) + shift for segment, shift in zip(segments, day_shifts)
+            ]),
+            events=np.concatenate([segment.events for segment in segments]),
+            starts=np.concatenate([segment.starts for segment in segments]),
+            ends=np.concatenate([segment.ends for segment in segments]),
+        )
+
+    def window(self, start_date, end_date):
+        """The rows from `start_date` to `end_date` inclusive."""
+        start_day, end_day = (
+            (np.datetime64(date, "D") - self.origin).astype(int) for date in (start_date, end_date)
+        )
+        rows = slice(
+            np.searchsorted(self.days, start_day, side="left"),
+            np.searchsorted(self.days, end_day, side="right"),
+        )
+        return TwilightYear(
+            self.year, self.days[rows], self.events[rows], self.starts[rows], self.ends[rows]
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        arrays = (
+            self.days,
+            self.events,
+            self.starts,
+            self.ends,
+            self.day_rows,
+            self.day_lengths,
+            self.event_order,
+            self.event_offsets,
+        )
+        return sum(array.nbytes for array in arrays)
+
+    def day_index(self, date):
+        """Position of `date` in day_rows and day_lengths, or None outside the year."""
+        day = (np.datetime64(date, "D") - self.origin).astype(int) - self.first_day
+        if not 0 <= day < len(self.day_lengths):
+            return None
+        return day
+
+    def rows(self, date):
+        """Slice of the rows for `date`, empty when it is outside the year."""
+        day = self.day_index(date)
+        if day is None:
+            return slice(0, 0)
+        return slice(self.day_rows[day], self.day_rows[day + 1])
+
+    def event_rows(self, event_type):
+        """Row numbers of `event_type` in date order."""
+        code = EVENT_CODES[event_type]
+        return self.event_order[self.event_offsets[code]:self.event_offsets[code + 1]]
+
+    def day_length(self, date):
+        day = self.day_index(date)
+        if day is None:
+            return timedelta(0)
+        return timedelta(seconds=int(self.day_lengths[day]))
+
+    def to_frame(self, rows=slice(None)):
+        """The rows as the Date, Event, Starts and Ends DataFrame charts use."""
+        min_time = np.datetime64(MIN_TIME, "ns")
+        dates = self.origin + self.days[rows].astype("timedelta64[D]")
+        return pd.DataFrame(
+            {
+                "Date": dates.astype("datetime64[ns]"),
+                "Event": EVENT_NAMES[self.events[rows]].astype(object),
+                "Starts": min_time + self.starts[rows].astype("timedelta64[s]"),
+                "Ends": min_time + self.ends[rows].astype("timedelta64[s]"),
+            }
+        )
+
+
+def local_times(times, city_timezone):
+    """Naive local datetimes for skyfield times, truncated to whole seconds.
+
+    Matches Time.astimezone(), which rounds UTC to the microsecond first.
+    """
+    year, month, day, hour, minute, second = (
+        np.atleast_1d(component) for component in (times + HALF_MICROSECOND).utc
+    )
+    months = (year.astype(int) - 1970) * 12 + month.astype(int) - 1
+    dates = months.astype("datetime64[M]").astype("datetime64[D]")
+    dates += (day.astype(int) - 1).astype("timedelta64[D]")
+    # Leap seconds are folded into second 59 like datetime does
+    seconds = np.minimum(np.floor(second), 59).astype(int)
+    seconds += hour.astype(int) * 3600 + minute.astype(int) * 60
+    utc_times = dates.astype("datetime64[ns]") + seconds.astype("timedelta64[s]")
+    utc_index = pd.DatetimeIndex(utc_times).tz_localize("UTC")
+    return utc_index.tz_convert(city_timezone).tz_localize(None)
+
 
 class SunriseGraph:
-    def __init__(self, city_dict, date):
-        self.timescale = load.timescale()
-        self.eph = load("de421.bsp")
+    """Sunrise charts for a city over the local calendar years from `date`
+    to `end_date`, one year when no end is given.
+
+    Each year is computed and cached on its own, and extend_to() adds
+    neighbouring years without touching the ones already loaded.
+    """
+
+    def __init__(self, city_dict, date, precision=1.0, end_date=None):
+        self.precision = precision
+        self.timescale = get_timescale()
+        self.eph = get_ephemeris()
         self.city = None
+        self.city_id = None
         self.timezone = None
+        self.location = None
         self.twilight_phases = None
+        self.year = None
+        self.years = None
         self.min_time = None
         self.max_time = None
         self.min_date = None
         self.max_date = None
+        self.cache_key = None
         self.event_types = {
             "Night": "#39304A",
             "Astronomical dawn": "#693f59",
@@ -33,147 +518,134 @@ class SunriseGraph:
             "Day": "#ffd27d",
         }
         self.set_timezone(city_dict)
-        self.set_year(int(date[0:4]))
-        self.sunrise_data = self.format_sunrise_data()
+        self.set_years(int(date[0:4]), int((end_date or date)[0:4]))
+        self.sunrise_data = TwilightYear.join([self.load_year(year) for year in self.years])
 
-    def create_charts(self, date):
-        sunrise_chart = self.create_graph(self.sunrise_data)
-        date_line = self.add_date_line(date)
-        sunrise_chart = sunrise_chart + date_line
+    def create_year_chart(self, compact=True):
+        """Serialised sunrise chart for the year, cached per city and year.
+
+        The date line follows the chart's selected_date parameter, so the
+        same bytes serve every date in the year.
+        """
+        return sunrise_cache.get_or_compute_chart(
+            self.cache_key + (compact,), lambda: self.create_graph_spec(compact)
+        )
+
+    def create_range_chart(self, start_date, end_date, compact=True):
+        """Serialised sunrise chart from `start_date` to `end_date` inclusive."""
+        return sunrise_cache.get_or_compute_chart(
+            (self.city, self.timezone.zone, start_date, end_date, compact),
+            lambda: self.create_graph_spec(compact, start_date, end_date),
+        )
+
+    def create_graph_spec(self, compact=True, start_date=None, end_date=None):
+        sunrise_data = self.sunrise_data
+        if start_date is not None:
+            sunrise_data = sunrise_data.window(start_date, end_date)
+        sunrise_chart = self.create_graph(sunrise_data, compact) + self.add_date_line()
+        return json.dumps(sunrise_chart.to_dict(), separators=(",", ":")).encode()
+
+    def create_date_charts(self, date):
+        """The date chart and daylight summary for `date` as JSON bytes."""
+        # The summary compares with the day before and after, which may be in
+        # a neighbouring year
+        today = datetime.strptime(date, "%Y-%m-%d")
+        self.extend_to(today - timedelta(1))
+        self.extend_to(today + timedelta(1))
         date_chart = self.create_date_chart(date, self.sunrise_data)
         daylight_summary = self.daylight_hours(date, self.sunrise_data)
-        return sunrise_chart, date_chart, daylight_summary
+        return b"".join([
+            b'{"date_chart":',
+            date_chart.to_json(indent=None).encode(),
+            b',"daylight_summary":',
+            json.dumps(daylight_summary).encode(),
+            b"}",
+        ])
 
     def set_timezone(self, city_dict):
         self.city = city_dict["city_name"]
-        string_timezone = TimezoneFinder().timezone_at(
-            lng=city_dict["longitude"], lat=city_dict["latitude"]
-        )
-        self.timezone = timezone(string_timezone)
-        location = wgs84.latlon(
+        self.city_id = city_dict.get("id")
+        self.timezone = city_timezone(city_dict)
+        self.location = wgs84.latlon(
             float(city_dict["latitude"]) * N, float(city_dict["longitude"]) * E
         )
-        self.twilight_phases = almanac.dark_twilight_day(self.eph, location)
-
-    def set_year(self, year):
-        days = 365
-        if year % 4:
-            days = 367
-        now = self.timezone.localize(datetime(year, 1, 1))
-        self.min_time = datetime(1900, 1, 1, 0, 0)
-        self.max_time = datetime(1900, 1, 1, 23, 59, 59)
-        self.min_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        self.max_date = self.min_date + timedelta(days=days)
-
-    def format_sunrise_data(self):
-        t0 = self.timescale.from_datetime(self.min_date)
-        t1 = self.timescale.from_datetime(self.max_date)
-        times, events = almanac.find_discrete(t0, t1, self.twilight_phases)
-
-        twilight_data = []
-        for index, (time, event) in enumerate(zip(times, events)):
-            twilight_event = almanac.TWILIGHTS[event]
-            start_date, start_time = self.format_time(time)
-            if index == len(times) - 1:
-                end_date, end_time = self.format_time(t1)
-            else:
-                end_date, end_time = self.format_time(times[index + 1])
-            twilight_event = twilight_event.replace("twilight", "dawn")
-            if start_time.hour > 12:
-                twilight_event = twilight_event.replace("dawn", "dusk")
-            data = self.process_twilight_data(
-                twilight_event, start_date, start_time, end_date, end_time
-            )
-            twilight_data += data
-        sunrise_df = pd.DataFrame.from_dict(twilight_data)
-        return sunrise_df
+        self.twilight_phases = almanac.dark_twilight_day(self.eph, self.location)
 
-    def process_twilight_data(
-        self, twilight_event, start_date, start_time, end_date, end_time
-    ):
-        twilight_data = []
-        data_dict = {
-            "Date": start_date,
-            "Event": twilight_event,
-            "Starts": start_time,
-            "Ends": end_time,
-        }
-        if end_date > start_date:
-            data_dict = {
-                "Date": start_date,
-                "Event": twilight_event,
-                "Starts": start_time,
-                "Ends": self.max_time,
-            }
-            twilight_data.append(data_dict)
-            date_diff = (end_date - start_date).days
-            if date_diff > 1:
-                count = 0
-                while True:
-                    count += 1
-                    date = start_date + timedelta(days=count)
-                    data_dict = {
-                        "Date": date,
-                        "Event": twilight_event,
-                        "Starts": self.min_time,
-                        "Ends": self.max_time,
-                    }
-                    twilight_data.append(data_dict)
-                    if date_diff == count:
-                        break
-            twilight_event = twilight_event.replace("dusk", "dawn+1")
-            data_dict = {
-                "Date": end_date,
-                "Event": twilight_event,
-                "Starts": self.min_time,
-                "Ends": end_time,
-            }
-        twilight_data.append(data_dict)
-        return twilight_data
-
-    def create_graph(self, sunrise_data):
-        def background():
-            theme = {
-                "config": {
-                    "view": {"height": 300, "width": 300, "fill": "#39304A"},
-                    "title": {
-                        "anchor": "start",
-                        "dy": -15,
-                        "fontSize": 24,
-                        "fontWeight": 600,
-                        "color": "#2f5275",
-                    },
-                    "area": {"fill": "#909090"},
-                }
-            }
-            return theme
+    def set_years(self, first_year, last_year):
+        self.year = first_year
+        self.years = range(first_year, last_year + 1)
+        self.min_time = MIN_TIME
+        self.max_time = MAX_TIME
+        self.min_date = year_bounds(self.timezone, first_year)[0]
+        self.max_date = year_bounds(self.timezone, last_year)[1]
+        self.cache_key = (self.city, self.year, self.timezone.zone)
+
+    def extend_to(self, date):
+        """Make sunrise_data cover `date`, loading only the years it lacks."""
+        year = date.year
+        first_year, last_year = self.years[0], self.years[-1]
+        if year < first_year:
+            segments = [self.load_year(missing) for missing in range(year, first_year)]
+            self.sunrise_data = TwilightYear.join(segments + [self.sunrise_data])
+            self.set_years(year, last_year)
+        elif year > last_year:
+            segments = [self.load_year(missing) for missing in range(last_year + 1, year + 1)]
+            self.sunrise_data = TwilightYear.join([self.sunrise_data] + segments)
+            self.set_years(first_year, year)
+
+    def load_year(self, year):
+        return sunrise_cache.get_or_compute(
+            (self.city, year, self.timezone.zone), lambda: self.format_sunrise_data(year)
+        )
+
+    def format_sunrise_data(self, year=None):
+        year = self.year if year is None else year
+        min_date, max_date = year_bounds(self.timezone, year)
+        t0 = self.timescale.from_datetime(min_date)
+        t1 = self.timescale.from_datetime(max_date)
+        times, events = self.find_twilight_events(year, t0, t1)
+        times, events = with_initial_state(self.twilight_phases, t0, times, events)
+        return build_twilight_year(times, events, t1, self.timezone, year)
 
-        alt.themes.register("background", background)
-        alt.themes.enable("background")
+    def find_twilight_events(self, year, t0, t1):
+        if self.city_id is not None:
+            stored_events = load_twilight_events(self.timescale, self.city_id, year)
+            if stored_events:
+                return stored_events
+        times, events = find_twilight_transitions(
+            self.eph, self.location, t0, t1, self.precision
+        )
+        if self.city_id is not None:
+            save_twilight_events(self.city_id, year, times, events)
+        return times, events
 
+    def create_graph(self, sunrise_data, compact=False):
         chart = alt.LayerChart(title=f"Sunrise Chart: {self.city}")
         legend_y_position = 40
 
         y_axis_limits = list(["1900-01-01T00:00:00", "1900-01-02T00:00:00"])
         y_scale = alt.Scale(domain=y_axis_limits, reverse=True)
+        if not compact:
+            sunrise_df = sunrise_data.to_frame()
 
         for event_type, fill in self.event_types.items():
             if event_type != "Night":
-                event_chart = (
-                    alt.Chart(sunrise_data)
-                    .mark_area(color=fill)
-                    .encode(
-                        x="Date:T",
-                        y=alt.Y("Starts:T", scale=y_scale),
-                        y2="Ends:T",
-                        tooltip=[
-                            "Event",
-                            "Date",
-                            alt.Tooltip("Starts", format="%H:%M"),
-                            alt.Tooltip("Ends", format="%H:%M"),
-                        ],
+                if compact:
+                    event_chart = self.compact_event_chart(sunrise_data, event_type)
+                else:
+                    event_chart = alt.Chart(sunrise_df).transform_filter(
+                        datum.Event == event_type
                     )
-                    .transform_filter(datum.Event == event_type)
+                event_chart = event_chart.mark_area(color=fill).encode(
+                    x="Date:T",
+                    y=alt.Y("Starts:T", scale=y_scale),
+                    y2="Ends:T",
+                    tooltip=[
+                        "Event:N",
+                        "Date:T",
+                        alt.Tooltip("Starts:T", format="%H:%M"),
+                        alt.Tooltip("Ends:T", format="%H:%M"),
+                    ],
                 )
                 legend_x_position = 820
                 legend_y_position += 15
@@ -207,9 +679,35 @@ class SunriseGraph:
         chart = chart.interactive()
         return chart
 
+    def compact_event_chart(self, sunrise_data, event_type):
+        """Chart over one event's rows as inline CSV of small integers.
+
+        Each row is the day of the year and the start and end as seconds
+        after midnight; the chart turns them back into the Date, Starts and
+        Ends fields create_graph encodes, so no client-side filter is needed.
+        """
+        event_rows = sunrise_data.event_rows(event_type)
+        compact_data = pd.DataFrame({
+            "d": sunrise_data.days[event_rows] + 1,
+            "s": sunrise_data.starts[event_rows],
+            "e": sunrise_data.ends[event_rows],
+        })
+        values = alt.InlineData(
+            values=compact_data.to_csv(index=False),
+            format=alt.CsvDataFormat(
+                type="csv", parse={"d": "number", "s": "number", "e": "number"}
+            ),
+        )
+        return alt.Chart(values).transform_calculate(
+            Event=json.dumps(event_type),
+            Date=f"datetime({sunrise_data.year}, 0, datum.d)",
+            Starts="datetime(1900, 0, 1, 0, 0, datum.s)",
+            Ends="datetime(1900, 0, 1, 0, 0, datum.e)",
+        )
+
     def create_date_chart(self, date, sunrise_data):
 
-        def add_date_chart_legend(chart, date_df):
+        def add_date_chart_legend(chart, date_df, date_phases):
             legend_x_position = -20
             legend_y_position = 150
             for event_type, fill in self.event_types.items():
@@ -217,9 +715,7 @@ class SunriseGraph:
                     event_type.endswith(string) for string in ["dusk", "Day", "Night"]
                 ):
                     event_type = event_type.split(" ")[0]
-                    times_df = date_df.loc[
-                        date_df["Event"].str.contains(event_type), ["Starts", "Ends"]
-                    ]
+                    times_df = date_df.loc[date_phases == event_type, ["Starts", "Ends"]]
                     text = [event_type]
                     for row in times_df.itertuples():
                         text.append(
@@ -232,9 +728,9 @@ class SunriseGraph:
                     legend_x_position += 150
             return chart
 
-        date_df = sunrise_data.loc[
-            sunrise_data["Date"] == date, ["Date", "Event", "Starts", "Ends"]
-        ]
+        date_rows = sunrise_data.rows(date)
+        date_df = sunrise_data.to_frame(date_rows)
+        date_phases = EVENT_PHASES[sunrise_data.events[date_rows]]
         date_object = datetime.strptime(date, "%Y-%m-%d")
         chart = alt.LayerChart().encode(
             alt.X(axis=alt.Axis(format="%H:%M", tickCount=9)).title("Hour"),
@@ -245,7 +741,7 @@ class SunriseGraph:
             labelFontSize=12,
             titleFontSize=12,
         )
-        chart = add_date_chart_legend(chart, date_df)
+        chart = add_date_chart_legend(chart, date_df, date_phases)
 
         date_chart = (
             alt.Chart(date_df)
@@ -282,7 +778,7 @@ class SunriseGraph:
         yesterday = today - timedelta(1)
         tomorrow = today + timedelta(1)
         yesterday_length, today_length, tomorrow_length = (
-            self.day_length(sunrise_data, day) for day in [yesterday, today, tomorrow]
+            sunrise_data.day_length(day) for day in [yesterday, today, tomorrow]
         )
         styled_today_length = self.style_timedelta(today_length)
         shorter_html_string = '<span style="color: #a30000">shorter.</span>'
@@ -343,10 +839,11 @@ class SunriseGraph:
         legend_box = box + text
         return legend_box
 
-    def add_date_line(self, date):
-        formatted_date = datetime.strptime(date, "%Y-%m-%d")
+    def add_date_line(self):
+        selected_date = alt.param(
+            name=SELECTED_DATE_PARAM, value=f"{self.year}-01-01T00:00:00"
+        )
         date_dict = {
-            "Date": [formatted_date, formatted_date],
             "Starts": [datetime.strptime(time, "%H:%M") for time in ["00:00", "23:59"]],
         }
         date_df = pd.DataFrame(data=date_dict)
@@ -354,6 +851,7 @@ class SunriseGraph:
             alt.Chart(date_df)
             .mark_line(color="#FFFFFF")
             .encode(x="Date:T", y="Starts:T")
+            .transform_calculate(Date=alt.expr.toDate(selected_date))
         )
         text = date_line_chart.mark_text(
             align="center",
@@ -362,7 +860,7 @@ class SunriseGraph:
             fontWeight="bold",
             color="#08415C",
         ).encode(
-            text="Date",
+            text="Date:T",
             opacity=alt.condition(
                 alt.datum.Starts == alt.expr.toDate("1900-01-01T00:00"),
                 alt.value(1),
@@ -370,25 +868,7 @@ class SunriseGraph:
             ),
         )
         date_line_chart += text
-        return date_line_chart
-
-    def format_time(self, time):
-        time_string = str(time.astimezone(self.timezone))[:19]
-        date_x, time_x = time_string.split(" ")
-        date_object = datetime.strptime(date_x, "%Y-%m-%d")
-        date_object = date_object.replace(hour=0, minute=0, second=0, microsecond=0)
-        time_object = datetime.strptime(time_x, "%H:%M:%S")
-        return date_object, time_object
-
-    def day_length(self, sunrise_data, date_object):
-        date_string = date_object.strftime("%Y-%m-%d")
-        date_df = sunrise_data.loc[
-            (sunrise_data["Date"] == date_string) & (sunrise_data["Event"] == "Day")
-        ]
-        day_length = timedelta(0)
-        for row in date_df.itertuples():
-            day_length += row.Ends - row.Starts
-        return day_length
+        return date_line_chart.add_params(selected_date)
 
     def style_timedelta(self, duration):
         total_seconds = duration.total_seconds()
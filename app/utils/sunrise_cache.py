@@ -0,0 +1,288 @@
+import fcntl
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+# Bump when cached values change shape or content so stale shared files are ignored
+CACHE_VERSION = 5
+
+
+def key_digest(key):
+    return hashlib.sha1(repr((CACHE_VERSION, key)).encode()).hexdigest()
+
+
+def size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """In-process cache bounded by both entry count and approximate memory."""
+
+    def __init__(self, max_entries=64, max_bytes=128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def set(self, key, value):
+        size = size_of(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while self.entries and (
+                len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+            }
+
+
+class SharedCache:
+    """Pickle files in a directory every gunicorn worker on the host can read.
+
+    Reads touch a file's mtime, and each write removes the least recently
+    used files until the directory's pickles fit in `max_bytes` again.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key_digest(key)}.pkl")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                value = pickle.load(cache_file)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # Write to a temporary file and rename so readers never see a partial file
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as cache_file:
+                pickle.dump(value, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            logger.exception(f"Could not write {key} to the shared sunrise cache")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.prune()
+
+    def prune(self):
+        """Remove the least recently used pickles until they fit in max_bytes."""
+        files = []
+        total_bytes = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".pkl"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another worker removed or replaced it first
+                continue
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class SingleFlight:
+    """Per-key locks so concurrent misses for one key compute it only once.
+
+    Threads in a worker queue on an in-process lock. When a directory is
+    given, the holder also takes an flock on one of `lock_files` lock files
+    there, picked by the key's digest, so workers sharing that directory
+    wait on each other as well. Keys that share a lock file also wait on
+    each other across workers, which keeps the directory to a fixed set of
+    files.
+    """
+
+    def __init__(self, directory=None, lock_files=64):
+        self.directory = directory
+        self.lock_files = lock_files
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.waits = 0
+
+    @contextmanager
+    def hold(self, key):
+        with self.lock:
+            entry = self.locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            if entry[0].locked():
+                self.waits += 1
+            with entry[0]:
+                if self.directory is None:
+                    yield
+                else:
+                    with open(self.lock_path(key), "a") as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                        try:
+                            yield
+                        finally:
+                            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
+
+    def lock_path(self, key):
+        bucket = int(key_digest(key), 16) % self.lock_files
+        return os.path.join(self.directory, f"flight-{bucket}.lock")
+
+    def stats(self):
+        return {"in_flight": len(self.locks), "waits": self.waits}
+
+
+class SunriseCache:
+    """Two-tier cache of sunrise data keyed by (city_name, year, timezone).
+
+    Lookups try the per-worker LRU first, then the optional shared disk tier,
+    and only call the compute function when both miss. Serialised chart specs
+    for the same keys are kept in a separate per-worker LRU. Concurrent misses
+    for one key wait on a single computation, across workers too when the
+    shared tier is configured.
+    """
+
+    def __init__(self, app=None):
+        self.memory = LRUCache()
+        self.charts = LRUCache()
+        self.shared = None
+        self.flights = SingleFlight()
+        self.chart_flights = SingleFlight()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.memory = LRUCache(
+            max_entries=app.config["SUNRISE_CACHE_MAX_ENTRIES"],
+            max_bytes=app.config["SUNRISE_CACHE_MAX_BYTES"],
+        )
+        self.charts = LRUCache(
+            max_entries=app.config["SUNRISE_CHART_CACHE_MAX_ENTRIES"],
+            max_bytes=app.config["SUNRISE_CHART_CACHE_MAX_BYTES"],
+        )
+        if app.config["SUNRISE_CACHE_DIR"]:
+            self.shared = SharedCache(
+                app.config["SUNRISE_CACHE_DIR"],
+                max_bytes=app.config["SUNRISE_CACHE_DIR_MAX_BYTES"],
+            )
+            self.flights = SingleFlight(app.config["SUNRISE_CACHE_DIR"])
+
+    def __contains__(self, key):
+        return key in self.memory or (self.shared is not None and key in self.shared)
+
+    def get_or_compute(self, key, compute):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        with self.flights.hold(key):
+            # Whoever held the key before us may have filled either tier
+            value = self.memory.get(key)
+            if value is not None:
+                return value
+            if self.shared is not None:
+                value = self.shared.get(key)
+            if value is None:
+                value = compute()
+                if self.shared is not None:
+                    self.shared.set(key, value)
+            self.memory.set(key, value)
+        return value
+
+    def get_or_compute_chart(self, key, compute):
+        value = self.charts.get(key)
+        if value is not None:
+            return value
+        with self.chart_flights.hold(key):
+            value = self.charts.get(key)
+            if value is not None:
+                return value
+            value = compute()
+            self.charts.set(key, value)
+        return value
+
+    def stats(self):
+        stats = {
+            "memory": self.memory.stats(),
+            "charts": self.charts.stats(),
+            "flights": self.flights.stats(),
+        }
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+
+sunrise_cache = SunriseCache()
@@ -0,0 +1,97 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.utils.sunrise import SunriseGraph
+from app.utils.sunrise_cache import sunrise_cache
+from app.utils.timezones import city_timezone
+from app.utils.twilight_store import has_twilight_events
+
+logger = logging.getLogger(__name__)
+
+
+def job_id(city_id, year):
+    return f"{city_id}-{year}"
+
+
+def parse_job_id(value):
+    """(city_id, year) for a job id, or None when it is malformed."""
+    city_id, _, year = value.partition("-")
+    if not (city_id.isdigit() and year.isdigit()):
+        return None
+    return int(city_id), int(year)
+
+
+def warm_year(city_dict, year):
+    SunriseGraph(city_dict, f"{year}-01-01")
+
+
+class SunriseJobs:
+    """Computes cold city-years on a background thread pool.
+
+    Requests for a city-year that is in neither the sunrise cache nor the
+    twilight store hand it to the pool and answer 202 straight away, so a
+    worker is not tied up while it is solved. Jobs are keyed "city_id-year"
+    and a city-year already in flight is never submitted twice.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self.jobs = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_wait = app.config["SUNRISE_JOB_MAX_WAIT"]
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config["SUNRISE_JOB_WORKERS"], thread_name_prefix="sunrise-job"
+        )
+
+    def is_ready(self, city_dict, year):
+        key = (city_dict["city_name"], year, city_timezone(city_dict).zone)
+        return key in sunrise_cache or has_twilight_events(city_dict["id"], year)
+
+    def submit_cold_years(self, city_dict, years):
+        """Start jobs for the years not ready yet and return their ids."""
+        return [
+            self.submit(city_dict, year) for year in years if not self.is_ready(city_dict, year)
+        ]
+
+    def submit(self, city_dict, year):
+        key = job_id(city_dict["id"], year)
+        with self.lock:
+            future = self.jobs.get(key)
+            # A failed job is retried by the next request for it
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.executor.submit(self.run, key, city_dict, year)
+                self.jobs[key] = future
+        return key
+
+    def run(self, key, city_dict, year):
+        try:
+            with self.app.app_context():
+                warm_year(city_dict, year)
+        except Exception:
+            logger.exception(f"Sunrise job {key} failed")
+            raise
+        with self.lock:
+            # Finished jobs are answered from the cache and store from now on
+            self.jobs.pop(key, None)
+
+    def status(self, key, wait_seconds=0):
+        """Job state: running, done or failed, or None when this worker has no such job."""
+        with self.lock:
+            future = self.jobs.get(key)
+        if future is None:
+            return None
+        if wait_seconds:
+            wait([future], timeout=min(wait_seconds, self.max_wait))
+        if not future.done():
+            return "running"
+        return "failed" if future.exception() is not None else "done"
+
+
+sunrise_jobs = SunriseJobs()
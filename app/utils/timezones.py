@@ -0,0 +1,27 @@
+import threading
+
+from pytz import timezone
+from timezonefinder import TimezoneFinder
+
+lock = threading.Lock()
+finders = []
+
+
+def get_timezone_finder():
+    """One TimezoneFinder per process, built on first use."""
+    with lock:
+        if not finders:
+            finders.append(TimezoneFinder())
+        return finders[0]
+
+
+def find_timezone_name(latitude, longitude):
+    return get_timezone_finder().timezone_at(lng=float(longitude), lat=float(latitude))
+
+
+def city_timezone(city_dict):
+    """The city's stored timezone, or a lookup for user-supplied coordinates."""
+    timezone_name = city_dict.get("timezone") or find_timezone_name(
+        city_dict["latitude"], city_dict["longitude"]
+    )
+    return timezone(timezone_name)
@@ -0,0 +1,51 @@
+import logging
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, CityTwilight
+
+logger = logging.getLogger(__name__)
+
+
+def load_twilight_events(timescale, city_id, year):
+    record = CityTwilight.query.filter_by(city_location_id=city_id, year=year).first()
+    if not record:
+        return None
+    whole, fraction = np.frombuffer(record.times, dtype=np.float64).reshape(2, -1)
+    events = np.frombuffer(record.events, dtype=np.uint8)
+    return timescale.tt_jd(whole, fraction), events
+
+
+def twilight_record(city_id, year, times, events):
+    return CityTwilight(
+        city_location_id=city_id,
+        year=year,
+        times=np.stack([times.whole, times.tt_fraction]).astype(np.float64).tobytes(),
+        events=np.asarray(events, dtype=np.uint8).tobytes(),
+    )
+
+
+def save_twilight_events(city_id, year, times, events):
+    db.session.add(twilight_record(city_id, year, times, events))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same city and year first
+        db.session.rollback()
+        logger.info(f"Twilight events for city {city_id} in {year} already stored")
+
+
+def save_twilight_records(records):
+    db.session.add_all(records)
+    db.session.commit()
+
+
+def has_twilight_events(city_id, year):
+    query = CityTwilight.query.filter_by(city_location_id=city_id, year=year)
+    return db.session.query(query.exists()).scalar()
+
+
+def stored_city_ids(year):
+    rows = db.session.query(CityTwilight.city_location_id).filter_by(year=year)
+    return {row.city_location_id for row in rows}
@@ -1,50 +1,198 @@
-import json
 import logging
-from datetime import datetime
-from flask import render_template, jsonify, request
+from datetime import datetime, timedelta
+from flask import Response, abort, current_app, render_template, jsonify, request
 from flask_appbuilder import BaseView, SimpleFormView, expose
 from flask_appbuilder.widgets import ListWidget
 
 from app import appbuilder
 from app.forms import SunriseForm
 from app.models import CityLocations
-from app.utils.sunrise import SunriseGraph
+from app.utils.cities import city_registry
+from app.utils.copernicus import calculate_conjunctions
+from app.utils.ephemeris import FIRST_YEAR, LAST_YEAR
+from app.utils.sunrise import MAX_RANGE_YEARS, SunriseGraph
+from app.utils.sunrise_cache import sunrise_cache
+from app.utils.sunrise_jobs import parse_job_id, sunrise_jobs
 
 
 class SunriseWidget(ListWidget):
     template = "widgets/sunrise.html"
 
 
+def cacheable_response(body):
+    """JSON response browsers and proxies may keep, revalidated by ETag."""
+    response = Response(body, mimetype="application/json")
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["SUNRISE_MAX_AGE"]
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def job_response(status, jobs, code):
+    response = jsonify({"status": status, "jobs": jobs})
+    response.status_code = code
+    if code == 202:
+        response.headers["Retry-After"] = "1"
+    return response
+
+
 class SunriseView(SimpleFormView):
     route_base = "/sunriseview"
     form = SunriseForm
     form_title = "Sunrise Graph"
     edit_widget = SunriseWidget
 
-    defaults = {
-        "location": "Dublin, Ireland",
-        "date": datetime.now().strftime("%Y-%m-%d")
-    }
-    city_location = CityLocations.query.filter_by(city_name=defaults["location"]).first()
-    city_dict = city_location.to_json()
-    sun_graph = SunriseGraph(city_dict, defaults["date"])
-
-    @expose("/graph/", methods=["GET", "POST"])
-    def graph(self):
-        if self.form.validate_on_submit:
-            location = request.args.get("location")
-            date = request.args.get("date_select")
-            if location != self.defaults["location"]:
-                city_location = CityLocations.query.filter_by(city_name=location).first()
-                city_dict = city_location.to_json()
-                self.sun_graph = SunriseGraph(city_dict, date)
-            sunrise_chart, date_chart, daylight_summary = self.sun_graph.create_charts(date)
-            json_packet = {
-                "sunrise_chart": json.loads(sunrise_chart.to_json()),
-                "date_chart": json.loads(date_chart.to_json()),
-                "daylight_summary": daylight_summary,
+    def sunrise_city(self):
+        """The requested city, by ?location= name or the nearest to ?latitude=&longitude=."""
+        if "location" not in request.args and "latitude" in request.args:
+            city, _ = self.nearest_city()
+        else:
+            city = city_registry.get(request.args.get("location"))
+        if city is None:
+            abort(404)
+        return city.to_json()
+
+    def nearest_city(self):
+        latitude = request.args.get("latitude", type=float)
+        longitude = request.args.get("longitude", type=float)
+        if latitude is None or longitude is None or not (
+            -90 <= latitude <= 90 and -180 <= longitude <= 180
+        ):
+            abort(400)
+        nearest = city_registry.nearest(
+            latitude, longitude, current_app.config["CITY_NEAREST_MAX_KM"]
+        )
+        if nearest is None:
+            abort(404)
+        return nearest
+
+    def sunrise_graph(self, date, end_date=None, years=None):
+        """Graph for the requested location, or a 202 while its years compute.
+
+        Cold city-years are handed to the background job pool rather than
+        solved in the request; the client polls the returned job ids and
+        then repeats its request. `years` defaults to those from `date`
+        to `end_date`.
+        """
+        city_dict = self.sunrise_city()
+        if years is None:
+            years = range(int(date[0:4]), int((end_date or date)[0:4]) + 1)
+        jobs = sunrise_jobs.submit_cold_years(city_dict, years)
+        if jobs:
+            return None, job_response("pending", jobs, 202)
+        return SunriseGraph(city_dict, date, end_date=end_date), None
+
+    @expose("/year/", methods=["GET"])
+    def year(self):
+        year = request.args.get("year", type=int)
+        payload_format = request.args.get("format", "compact")
+        if (
+            year is None
+            or not FIRST_YEAR <= year <= LAST_YEAR
+            or payload_format not in ("compact", "full")
+        ):
+            abort(400)
+        sun_graph, pending = self.sunrise_graph(f"{year}-01-01")
+        if pending:
+            return pending
+        return cacheable_response(
+            sun_graph.create_year_chart(compact=payload_format == "compact")
+        )
+
+    @expose("/range/", methods=["GET"])
+    def date_range(self):
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
+        payload_format = request.args.get("format", "compact")
+        try:
+            start = datetime.strptime(start_date or "", "%Y-%m-%d")
+            end = datetime.strptime(end_date or "", "%Y-%m-%d")
+        except ValueError:
+            abort(400)
+        if (
+            end < start
+            or start.year < FIRST_YEAR
+            or end.year > LAST_YEAR
+            or end.year - start.year >= MAX_RANGE_YEARS
+            or payload_format not in ("compact", "full")
+        ):
+            abort(400)
+        sun_graph, pending = self.sunrise_graph(start_date, end_date)
+        if pending:
+            return pending
+        return cacheable_response(
+            sun_graph.create_range_chart(
+                start_date, end_date, compact=payload_format == "compact"
+            )
+        )
+
+    @expose("/date/", methods=["GET"])
+    def date(self):
+        date = request.args.get("date_select")
+        try:
+            day = datetime.strptime(date or "", "%Y-%m-%d")
+        except ValueError:
+            abort(400)
+        # The daylight summary also needs the days either side
+        if (day - timedelta(1)).year < FIRST_YEAR or (day + timedelta(1)).year > LAST_YEAR:
+            abort(400)
+        # A neighbouring year the summary needs must not be solved in the request either
+        years = range((day - timedelta(1)).year, (day + timedelta(1)).year + 1)
+        sun_graph, pending = self.sunrise_graph(date, years=years)
+        if pending:
+            return pending
+        return cacheable_response(sun_graph.create_date_charts(date))
+
+    @expose("/cities/", methods=["GET"])
+    def cities(self):
+        """Page of city names starting with ?q=, in the shape Select2 expects."""
+        prefix = request.args.get("q", "").strip()
+        page = max(request.args.get("page", 1, type=int), 1)
+        page_size = current_app.config["CITY_SEARCH_PAGE_SIZE"]
+        # Escape LIKE wildcards so a prefix match can use the city_name index
+        pattern = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_") + "%"
+        names = [
+            name
+            for name, in CityLocations.query.with_entities(CityLocations.city_name)
+            .filter(CityLocations.city_name.like(pattern, escape="/"))
+            .order_by(CityLocations.city_name)
+            .offset((page - 1) * page_size)
+            .limit(page_size + 1)
+        ]
+        return jsonify(
+            {
+                "results": [{"id": name, "text": name} for name in names[:page_size]],
+                "pagination": {"more": len(names) > page_size},
             }
-            return jsonify(json_packet)
+        )
+
+    @expose("/nearest/", methods=["GET"])
+    def nearest(self):
+        """The stored city closest to ?latitude=&longitude=, with its distance in km."""
+        city, distance = self.nearest_city()
+        return jsonify({"city_name": city.city_name, "distance_km": round(distance, 1)})
+
+    @expose("/job/<job_id>/", methods=["GET"])
+    def job(self, job_id):
+        """Status of a sunrise job, waiting up to ?wait= seconds for it to finish."""
+        parsed = parse_job_id(job_id)
+        if parsed is None or not FIRST_YEAR <= parsed[1] <= LAST_YEAR:
+            abort(404)
+        city_id, year = parsed
+        status = sunrise_jobs.status(job_id, request.args.get("wait", 0, type=float))
+        if status is None:
+            # Finished, or started by another worker process
+            city = city_registry.get_by_id(city_id)
+            if city is None:
+                abort(404)
+            city_dict = city.to_json()
+            if sunrise_jobs.is_ready(city_dict, year):
+                status = "done"
+            else:
+                sunrise_jobs.submit(city_dict, year)
+                status = "running"
+        code = {"running": 202, "done": 200, "failed": 500}[status]
+        return job_response(status, [job_id], code)
 
 
 class AstralPositionsView(BaseView):
@@ -55,6 +203,21 @@ class AstralPositionsView(BaseView):
     def comingsoon(self):
         return self.render_template("widgets/astral_positions.html")
 
+    @expose("/conjunctions/", methods=["GET"])
+    def conjunctions(self):
+        """Conjunctions and oppositions for ?start_year=&end_year=&pairs=sun-mars,venus-mars."""
+        pairs = request.args.get("pairs")
+        if pairs is not None:
+            pairs = [tuple(pair.split("-")) for pair in pairs.split(",")]
+        try:
+            table = calculate_conjunctions(
+                request.args.get("start_year", ""), request.args.get("end_year"), pairs
+            )
+        except ValueError as error:
+            abort(400, description=str(error))
+        table = table.rename(columns=lambda column: column.lower().replace(" ", "_"))
+        return cacheable_response(table.to_json(orient="records", date_format="iso"))
+
 
 class HomeView(BaseView):
     route_base = "/"
@@ -79,9 +242,15 @@ class HealthView(BaseView):
         greeting = "Hello World"
         return self.render_template("logged_user.html", greeting=greeting)
 
+    @expose("/cache/")
+    def cache(self):
+        return jsonify(sunrise_cache.stats())
+
 
 @appbuilder.app.after_request
 def add_header(response):
+    if response.cache_control.public:
+        return response
     response.cache_control.private = True
     response.cache_control.public = False
     response.headers["Cache-Control"] = "no-store, max-age=0"
@@ -0,0 +1,12 @@
+import os
+
+from app.utils.ephemeris import preload
+
+# Threaded workers, so a client long-polling /sunriseview/job/ for up to
+# SUNRISE_JOB_MAX_WAIT seconds holds a thread rather than a whole worker
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def on_starting(server):
+    preload()
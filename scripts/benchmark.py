@@ -0,0 +1,447 @@
+"""Benchmarks for the sunrise utilities.
+
+Run from the repository root, for example::
+
+    python scripts/benchmark.py format
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from skyfield import almanac
+
+try:
+    import vl_convert
+except ImportError:
+    vl_convert = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.sunrise import (  # noqa: E402
+    SunriseGraph,
+    build_twilight_year,
+    compute_twilight_batch,
+    find_twilight_transitions,
+)
+
+CITIES = {
+    "Dublin, Ireland": (53.349805, -6.26031),
+    "Accra, Ghana": (5.55711, -0.201238),
+    "Reykjavik, Iceland": (64.146582, -21.942635),
+    "Tromso, Norway": (69.649208, 18.955324),
+}
+
+
+def build_graph(city_name, year):
+    latitude, longitude = CITIES[city_name]
+    city_dict = {"city_name": city_name, "latitude": latitude, "longitude": longitude}
+    return SunriseGraph(city_dict, f"{year}-01-01")
+
+
+def legacy_format_time(graph, time):
+    time_string = str(time.astimezone(graph.timezone))[:19]
+    date_x, time_x = time_string.split(" ")
+    date_object = datetime.strptime(date_x, "%Y-%m-%d")
+    time_object = datetime.strptime(time_x, "%H:%M:%S")
+    return date_object, time_object
+
+
+def legacy_process_twilight_data(graph, twilight_event, start_date, start_time, end_date, end_time):
+    twilight_data = []
+    data_dict = {"Date": start_date, "Event": twilight_event, "Starts": start_time, "Ends": end_time}
+    if end_date > start_date:
+        data_dict = {"Date": start_date, "Event": twilight_event, "Starts": start_time, "Ends": graph.max_time}
+        twilight_data.append(data_dict)
+        date_diff = (end_date - start_date).days
+        if date_diff > 1:
+            for count in range(1, date_diff + 1):
+                date = start_date + timedelta(days=count)
+                twilight_data.append(
+                    {"Date": date, "Event": twilight_event, "Starts": graph.min_time, "Ends": graph.max_time}
+                )
+        twilight_event = twilight_event.replace("dusk", "dawn+1")
+        data_dict = {"Date": end_date, "Event": twilight_event, "Starts": graph.min_time, "Ends": end_time}
+    twilight_data.append(data_dict)
+    return twilight_data
+
+
+def legacy_build_sunrise_frame(graph, times, events, t1):
+    """The per-event loop format_sunrise_data used before vectorisation."""
+    twilight_data = []
+    for index, (time, event) in enumerate(zip(times, events)):
+        twilight_event = almanac.TWILIGHTS[event]
+        start_date, start_time = legacy_format_time(graph, time)
+        if index == len(times) - 1:
+            end_date, end_time = legacy_format_time(graph, t1)
+        else:
+            end_date, end_time = legacy_format_time(graph, times[index + 1])
+        twilight_event = twilight_event.replace("twilight", "dawn")
+        if start_time.hour > 12:
+            twilight_event = twilight_event.replace("dawn", "dusk")
+        twilight_data += legacy_process_twilight_data(
+            graph, twilight_event, start_date, start_time, end_date, end_time
+        )
+    return pd.DataFrame.from_dict(twilight_data)
+
+
+def benchmark_format(year, repeat):
+    print(f"Post-processing of find_discrete output for {year}")
+    for city_name in CITIES:
+        graph = build_graph(city_name, year)
+        t0 = graph.timescale.from_datetime(graph.min_date)
+        t1 = graph.timescale.from_datetime(graph.max_date)
+        times, events = almanac.find_discrete(t0, t1, graph.twilight_phases)
+
+        legacy = legacy_build_sunrise_frame(graph, times, events, t1)
+        # The loop also emits an empty row at midnight on the next 1 January
+        legacy = legacy[legacy["Date"].dt.year == year].reset_index(drop=True)
+        vectorised = build_twilight_year(times, events, t1, graph.timezone, year).to_frame()
+        assert legacy.equals(vectorised), f"{city_name}: results differ"
+
+        legacy_time = min(timeit.repeat(
+            lambda: legacy_build_sunrise_frame(graph, times, events, t1), number=1, repeat=repeat
+        ))
+        vectorised_time = min(timeit.repeat(
+            lambda: build_twilight_year(times, events, t1, graph.timezone, year),
+            number=1,
+            repeat=repeat,
+        ))
+        print(
+            f"  {city_name:<20} {len(times):>5} events  "
+            f"loop {legacy_time * 1000:8.1f} ms  "
+            f"vectorised {vectorised_time * 1000:6.1f} ms  "
+            f"speedup {legacy_time / vectorised_time:5.1f}x"
+        )
+
+
+def match_transitions(times, events, reference_times, reference_events):
+    """Seconds from each reference transition to the same event in `times`."""
+    errors = []
+    for reference_time, reference_event in zip(reference_times.tt, reference_events):
+        candidates = times.tt[events == reference_event]
+        errors.append(np.abs(candidates - reference_time).min() * 86400 if len(candidates) else np.inf)
+    return np.array(errors)
+
+
+def benchmark_solver(year, repeat):
+    print(f"find_twilight_transitions against almanac.find_discrete for {year}")
+    for city_name in CITIES:
+        graph = build_graph(city_name, year)
+        t0 = graph.timescale.from_datetime(graph.min_date)
+        t1 = graph.timescale.from_datetime(graph.max_date)
+        discrete_time = min(timeit.repeat(
+            lambda: almanac.find_discrete(t0, t1, graph.twilight_phases), number=1, repeat=repeat
+        ))
+        reference_times, reference_events = almanac.find_discrete(t0, t1, graph.twilight_phases)
+        print(f"  {city_name:<20} find_discrete {discrete_time * 1000:7.1f} ms, {len(reference_times)} events")
+        for precision in (1.0, 30.0):
+            solver_time = min(timeit.repeat(
+                lambda: find_twilight_transitions(graph.eph, graph.location, t0, t1, precision),
+                number=1,
+                repeat=repeat,
+            ))
+            times, events = find_twilight_transitions(graph.eph, graph.location, t0, t1, precision)
+            errors = match_transitions(times, events, reference_times, reference_events)
+            matched = errors < 60
+            print(
+                f"    precision {precision:4.0f} s  {solver_time * 1000:7.1f} ms  "
+                f"speedup {discrete_time / solver_time:4.1f}x  "
+                f"max error {errors[matched].max():5.2f} s  "
+                f"{len(times)} events, {(~matched).sum()} reference events unmatched"
+            )
+
+
+def benchmark_batch(year, repeat):
+    cities = pd.read_csv("app/static/city_locations.tsv", sep="\t").to_dict("records")
+    print(f"compute_twilight_batch for {len(cities)} cities in {year}")
+    batch_time = min(timeit.repeat(
+        lambda: compute_twilight_batch(cities, year), number=1, repeat=repeat
+    ))
+    sample = cities[:5]
+    single_time = min(timeit.repeat(
+        lambda: [SunriseGraph(city, f"{year}-01-01").format_sunrise_data() for city in sample],
+        number=1,
+        repeat=repeat,
+    ))
+    print(f"  batch {batch_time:6.2f} s for all cities")
+    print(f"  SunriseGraph {single_time / len(sample):6.2f} s per city, "
+          f"about {single_time / len(sample) * len(cities):6.0f} s for all cities")
+
+
+def benchmark_payload(year, repeat):
+    print(f"Year chart spec size, full against compact encoding for {year}")
+    if vl_convert is None:
+        print("  install vl-convert-python to also time rendering")
+    for city_name in CITIES:
+        graph = build_graph(city_name, year)
+        print(f"  {city_name}")
+        for compact in (False, True):
+            spec_time = min(timeit.repeat(
+                lambda: graph.create_graph_spec(compact), number=1, repeat=repeat
+            ))
+            spec = graph.create_graph_spec(compact)
+            line = (
+                f"    {'compact' if compact else 'full':<8} {len(spec) / 1024:7.1f} KiB  "
+                f"gzip {len(gzip.compress(spec)) / 1024:5.1f} KiB  "
+                f"built in {spec_time * 1000:6.1f} ms"
+            )
+            if vl_convert is not None:
+                render_time = min(timeit.repeat(
+                    lambda: vl_convert.vegalite_to_svg(json.loads(spec)), number=1, repeat=repeat
+                ))
+                line += f"  rendered in {render_time * 1000:6.1f} ms"
+            print(line)
+
+
+def legacy_day_length(sunrise_data, date_object):
+    """The DataFrame scan SunriseGraph.day_length used before TwilightYear."""
+    date_string = date_object.strftime("%Y-%m-%d")
+    date_df = sunrise_data.loc[
+        (sunrise_data["Date"] == date_string) & (sunrise_data["Event"] == "Day")
+    ]
+    day_length = timedelta(0)
+    for row in date_df.itertuples():
+        day_length += row.Ends - row.Starts
+    return day_length
+
+
+def benchmark_lookup(year, repeat):
+    print(f"Per-date lookups, DataFrame against TwilightYear for {year}")
+    dates = [datetime(year, 1, 1) + timedelta(days) for days in range(0, 365, 7)]
+    for city_name in CITIES:
+        twilight_year = build_graph(city_name, year).sunrise_data
+        sunrise_df = twilight_year.to_frame()
+        for date in dates:
+            assert legacy_day_length(sunrise_df, date) == twilight_year.day_length(date)
+        frame_time = min(timeit.repeat(
+            lambda: [legacy_day_length(sunrise_df, date) for date in dates], number=1, repeat=repeat
+        ))
+        array_time = min(timeit.repeat(
+            lambda: [twilight_year.day_length(date) for date in dates], number=1, repeat=repeat
+        ))
+        frame_bytes = sunrise_df.memory_usage(deep=True).sum()
+        print(
+            f"  {city_name:<20} {len(twilight_year):>5} rows  "
+            f"memory {frame_bytes / 1024:6.1f} -> {twilight_year.nbytes / 1024:5.1f} KiB  "
+            f"day_length {frame_time / len(dates) * 1e6:7.1f} -> "
+            f"{array_time / len(dates) * 1e6:5.1f} us"
+        )
+
+
+def legacy_relative_longitude(jd, body_1, body_2):
+    """relative_longitude as it was, observing both bodies on every call."""
+    from app.utils.copernicus import object_name, observe_longitudes, wrap_angle
+
+    first, second = sorted((body_1, body_2), key=object_name.index)
+    return wrap_angle(observe_longitudes(second, jd) - observe_longitudes(first, jd))
+
+
+def legacy_conjunctions(year, body_1, body_2):
+    """The monthly-grid, per-pair brentq search of calculate_conjunctions.
+
+    brentq is given float julian dates, as current scipy rejects Time bounds.
+    """
+    from scipy.optimize import brentq
+    from app.utils.copernicus import ts
+
+    t = ts.utc(year, range(13))
+    relative_lon = legacy_relative_longitude(t.tt, body_1, body_2)
+    inferior = (relative_lon >= 0)[:-1] & (relative_lon < 0)[1:]
+    superior = (relative_lon < 0)[:-1] & (relative_lon >= 0)[1:]
+    events = []
+    for i in (inferior | superior).nonzero()[0]:
+        jdt = brentq(legacy_relative_longitude, t[i].tt, t[i + 1].tt, args=(body_1, body_2))
+        if not (superior[i] and relative_lon[i + 1] - relative_lon[i] > 5.0):
+            events.append(jdt)
+        elif "sun" in (body_1, body_2):
+            events.append(jdt)
+    return events
+
+
+def benchmark_conjunctions(year, repeat):
+    from app.utils.copernicus import PAIRS, find_conjunctions, ts
+
+    print(f"Conjunctions and oppositions of all {len(PAIRS)} pairs in {year}")
+    legacy_time = min(timeit.repeat(
+        lambda: [legacy_conjunctions(year, *pair) for pair in PAIRS], number=1, repeat=repeat
+    ))
+    batch_time = min(timeit.repeat(lambda: find_conjunctions(year), number=1, repeat=repeat))
+    # Month 0 of ts.utc(year, range(13)) is the previous December, which the table leaves out
+    start_jd = ts.utc(year, 1, 1).tt
+    legacy = {
+        pair: [jdt for jdt in legacy_conjunctions(year, *pair) if jdt >= start_jd] for pair in PAIRS
+    }
+    table = find_conjunctions(year)
+    matched = 0
+    largest_difference = 0.0
+    for pair, events in legacy.items():
+        found = table.loc[(table["Body 1"] == pair[0]) & (table["Body 2"] == pair[1]), "TT"].to_numpy()
+        for jdt in events:
+            difference = np.abs(found - jdt).min() if len(found) else np.inf
+            if difference < 1:
+                matched += 1
+                largest_difference = max(largest_difference, difference)
+    legacy_count = sum(len(events) for events in legacy.values())
+    print(f"  per pair   {legacy_time:6.2f} s, {legacy_count} events")
+    print(f"  batch      {batch_time:6.2f} s, {len(table)} events")
+    print(f"  {matched} of the per-pair events found by the batch, "
+          f"largest difference {largest_difference * 86400:.3f} s")
+    span_time = min(timeit.repeat(lambda: find_conjunctions(1900, 2052), number=1, repeat=1))
+    print(f"  batch over 1900-2052 {span_time:6.2f} s")
+
+
+def benchmark_longitudes(year, repeat):
+    from app.utils.copernicus import (
+        LONGITUDE_ERROR_ARCSEC,
+        LongitudeCache,
+        interpolation_error,
+        object_name,
+        observe_longitudes,
+        ts,
+    )
+
+    print(f"Ecliptic longitudes on a 20-year daily grid from {year}, observed against cached")
+    jd = np.arange(ts.utc(year, 1, 1).tt, ts.utc(year + 20, 1, 1).tt)
+    for body in object_name:
+        observe_time = min(timeit.repeat(
+            lambda: observe_longitudes(body, jd), number=1, repeat=repeat
+        ))
+        cache = LongitudeCache()
+        started = time.perf_counter()
+        cache.longitudes(body, jd)
+        cold_time = time.perf_counter() - started
+        warm_time = min(timeit.repeat(lambda: cache.longitudes(body, jd), number=1, repeat=repeat))
+        error = interpolation_error(body, year, year + 19)
+        print(
+            f"  {body:<8} observed {observe_time * 1000:6.1f} ms  cached cold "
+            f"{cold_time * 1000:6.1f} ms, warm {warm_time * 1000:5.1f} ms  "
+            f"error {error:.4f} arcsec (bound {LONGITUDE_ERROR_ARCSEC})"
+        )
+
+
+def benchmark_retrogrades(year, repeat):
+    from app.utils.copernicus import calculate_retrogrades
+
+    print(f"Retrograde figures, every day against downsampled, for 20 years from {year} and 1900-2049")
+    for body in ("mercury", "mars", "saturn"):
+        for start_year, years in ((year, 20), (1900, 150)):
+            for max_points in (None, 2000):
+                calculate_retrogrades(start_year, body, years, max_points)
+                build_time = min(timeit.repeat(
+                    lambda: calculate_retrogrades(start_year, body, years, max_points),
+                    number=1,
+                    repeat=repeat,
+                ))
+                fig = calculate_retrogrades(start_year, body, years, max_points)
+                points = sum(len(trace.x) for trace in fig.data)
+                print(
+                    f"  {body:<8} {years:>3} years  {'every day' if max_points is None else 'downsampled':<11} "
+                    f"{points:>6} points  {len(fig.to_json()) / 1024:7.1f} KiB  "
+                    f"built in {build_time * 1000:6.1f} ms"
+                )
+
+
+GAZETTEER_ROWS = 100_000
+LEGACY_IMPORT_ROWS = 5_000
+
+
+def write_gazetteer(path, rows):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        "city_name": [f"Benchmark City {index}" for index in range(rows)],
+        "latitude": rng.uniform(-60, 70, rows).round(6),
+        "longitude": rng.uniform(-180, 180, rows).round(6),
+    }).to_csv(path, sep="\t", index=False)
+
+
+def legacy_add_city_locations(data):
+    """The row by row import seed_data used before import_city_locations."""
+    from flask_appbuilder.security.sqla.models import User
+    from app.models import CityLocations, db
+    from app.utils.timezones import find_timezone_name
+
+    user = User.query.filter_by(username="admin").first()
+    for row in data.itertuples():
+        city_in_db = CityLocations.query.filter_by(city_name=row.city_name).first()
+        if not city_in_db:
+            city = CityLocations(
+                city_name=row.city_name,
+                latitude=row.latitude,
+                longitude=row.longitude,
+                timezone=find_timezone_name(row.latitude, row.longitude),
+                created_by=user,
+                changed_by=user
+            )
+            db.session.add(city)
+    db.session.commit()
+
+
+def benchmark_import(year, repeat):
+    """Needs DATABASE_URL; the synthetic cities are deleted again afterwards."""
+    from app import create_app
+    from app.manager import import_city_locations
+    from app.models import CityLocations, db
+
+    create_app()
+
+    def delete_benchmark_cities():
+        CityLocations.query.filter(CityLocations.city_name.like("Benchmark City %")).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+
+    print(f"City import of a {GAZETTEER_ROWS}-row gazetteer, row by row against bulk")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gazetteer.tsv")
+        write_gazetteer(path, GAZETTEER_ROWS)
+        try:
+            started = time.perf_counter()
+            legacy_add_city_locations(pd.read_csv(path, sep="\t", nrows=LEGACY_IMPORT_ROWS))
+            legacy_time = time.perf_counter() - started
+            delete_benchmark_cities()
+            started = time.perf_counter()
+            added = import_city_locations(path)
+            bulk_time = time.perf_counter() - started
+            started = time.perf_counter()
+            import_city_locations(path)
+            rerun_time = time.perf_counter() - started
+        finally:
+            delete_benchmark_cities()
+    print(f"  row by row {legacy_time:6.2f} s for {LEGACY_IMPORT_ROWS} rows, "
+          f"about {legacy_time / LEGACY_IMPORT_ROWS * GAZETTEER_ROWS:6.0f} s for all rows")
+    print(f"  bulk       {bulk_time:6.2f} s for {added} rows")
+    print(f"  bulk rerun {rerun_time:6.2f} s with every row already stored")
+
+
+BENCHMARKS = {
+    "batch": benchmark_batch,
+    "conjunctions": benchmark_conjunctions,
+    "format": benchmark_format,
+    "import": benchmark_import,
+    "longitudes": benchmark_longitudes,
+    "lookup": benchmark_lookup,
+    "payload": benchmark_payload,
+    "retrogrades": benchmark_retrogrades,
+    "solver": benchmark_solver,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--year", type=int, default=datetime.now().year)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.year, args.repeat)
+
+
+if __name__ == "__main__":
+    main()